@@ -24,7 +24,94 @@ class Settings:
     MAX_MESSAGE_LENGTH: int = 1000
     MAX_MESSAGES_PER_SESSION: int = 100
     
+    # Conversation persistence (SQLite, written behind the request path)
+    CHAT_PERSISTENCE_ENABLED: bool = os.getenv('CHAT_PERSISTENCE_ENABLED', 'true').lower() == 'true'
+    CHAT_DB_PATH: str = os.getenv('CHAT_DB_PATH', os.path.join("data", "chat_history.db"))
+    CHAT_FLUSH_INTERVAL: float = float(os.getenv('CHAT_FLUSH_INTERVAL', '0.5'))
+    CHAT_FLUSH_BATCH_SIZE: int = int(os.getenv('CHAT_FLUSH_BATCH_SIZE', '200'))
+    # Sessions kept in memory; older ones are reloaded from the database when used
+    MAX_CACHED_SESSIONS: int = int(os.getenv('MAX_CACHED_SESSIONS', '1000'))
+    
+    # JSON file listing the corpora to serve; without it only the bundled corpus is served
+    CORPORA_CONFIG: str = os.getenv('CORPORA_CONFIG', os.path.join("app", "static", "corpora.json"))
+    
+    # Retrieval index: "weaviate" or "local" (in-process, see vector_index.py)
+    RETRIEVAL_BACKEND: str = os.getenv('RETRIEVAL_BACKEND', 'weaviate')
+    # Weaviate vector compression: none, pq, bq or sq (applied when a collection is created)
+    WEAVIATE_QUANTIZATION: str = os.getenv('WEAVIATE_QUANTIZATION', 'none')
+    WEAVIATE_PQ_TRAINING_LIMIT: int = int(os.getenv('WEAVIATE_PQ_TRAINING_LIMIT', '10000'))
+    # Candidates rescored at full precision by Weaviate for bq/sq
+    VECTOR_RESCORE_LIMIT: int = int(os.getenv('VECTOR_RESCORE_LIMIT', '200'))
+    # In-process index: none or int8, rescoring limit * factor candidates
+    LOCAL_INDEX_QUANTIZATION: str = os.getenv('LOCAL_INDEX_QUANTIZATION', 'int8')
+    LOCAL_INDEX_RESCORE_FACTOR: int = int(os.getenv('LOCAL_INDEX_RESCORE_FACTOR', '4'))
+    LOCAL_INDEX_CACHE_DIR: str = os.getenv('LOCAL_INDEX_CACHE_DIR', os.path.join("data", "index"))
+    
+    # Rate limiting (token buckets: burst capacity, refill per minute)
+    RATE_LIMIT_ENABLED: bool = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_SESSION_BURST: int = int(os.getenv('RATE_LIMIT_SESSION_BURST', '5'))
+    RATE_LIMIT_SESSION_PER_MINUTE: int = int(os.getenv('RATE_LIMIT_SESSION_PER_MINUTE', '20'))
+    RATE_LIMIT_IP_BURST: int = int(os.getenv('RATE_LIMIT_IP_BURST', '20'))
+    RATE_LIMIT_IP_PER_MINUTE: int = int(os.getenv('RATE_LIMIT_IP_PER_MINUTE', '60'))
+    # Estimated LLM tokens (prompt + max_tokens) per client IP
+    RATE_LIMIT_TOKENS_PER_MINUTE: int = int(os.getenv('RATE_LIMIT_TOKENS_PER_MINUTE', '20000'))
+    # "memory" (per worker) or "redis" (shared across workers, needs the redis package)
+    RATE_LIMIT_BACKEND: str = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_REDIS_URL: str = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    # Take the client IP from X-Forwarded-For (only behind a proxy you control, e.g. ngrok)
+    TRUST_PROXY_HEADERS: bool = os.getenv('TRUST_PROXY_HEADERS', 'false').lower() == 'true'
+    # Proxies in front of the app that append to X-Forwarded-For; the client IP is that many entries from the right
+    TRUSTED_PROXY_HOPS: int = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
+    
+    # Profiling: per-request via "X-Profile: 1" header or "?profile=1", plus /debug endpoints
+    PROFILING_ENABLED: bool = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+
+    # Chat engine caches for query embeddings and search results
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv('EMBEDDING_CACHE_SIZE', '2048'))
+    RETRIEVAL_CACHE_SIZE: int = int(os.getenv('RETRIEVAL_CACHE_SIZE', '2048'))
+    CACHE_TTL_SECONDS: float = float(os.getenv('CACHE_TTL_SECONDS', '3600'))
+    ANSWER_CACHE_SIZE: int = int(os.getenv('ANSWER_CACHE_SIZE', '512'))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv('ANSWER_CACHE_TTL_SECONDS', '86400'))
+
+    # Startup warm-up: replay frequent queries in the background to fill the caches
+    WARMUP_ENABLED: bool = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    # One query per line; blank lines and lines starting with "#" are skipped
+    WARMUP_QUERIES_FILE: str = os.getenv('WARMUP_QUERIES_FILE', os.path.join('app', 'static', 'warmup_queries.txt'))
+    # Also replay the N most asked questions stored by the previous run (0 to disable)
+    WARMUP_TOP_QUERIES: int = int(os.getenv('WARMUP_TOP_QUERIES', '50'))
+    # Generate and keep answers for the warm-up queries (costs one LLM call each)
+    WARMUP_PRECOMPUTE_ANSWERS: bool = os.getenv('WARMUP_PRECOMPUTE_ANSWERS', 'false').lower() == 'true'
+    WARMUP_CONCURRENCY: int = int(os.getenv('WARMUP_CONCURRENCY', '4'))
+
+    # Load-based degradation: full -> reduced max_tokens -> retrieval-only excerpts -> 503
+    DEGRADATION_ENABLED: bool = os.getenv('DEGRADATION_ENABLED', 'true').lower() == 'true'
+    DEGRADE_REDUCED_INFLIGHT: int = int(os.getenv('DEGRADE_REDUCED_INFLIGHT', '16'))
+    DEGRADE_SHED_INFLIGHT: int = int(os.getenv('DEGRADE_SHED_INFLIGHT', '64'))
+    DEGRADE_REDUCED_LATENCY_MS: float = float(os.getenv('DEGRADE_REDUCED_LATENCY_MS', '8000'))
+    DEGRADE_CRITICAL_LATENCY_MS: float = float(os.getenv('DEGRADE_CRITICAL_LATENCY_MS', '20000'))
+    DEGRADE_FAILURE_THRESHOLD: int = int(os.getenv('DEGRADE_FAILURE_THRESHOLD', '3'))
+    DEGRADE_COOLDOWN_SECONDS: float = float(os.getenv('DEGRADE_COOLDOWN_SECONDS', '30'))
+    DEGRADE_MAX_TOKENS: int = int(os.getenv('DEGRADE_MAX_TOKENS', '256'))
+
     # TogetherAI settings
     TOGETHER_API_KEY: str = os.getenv('TOGETHER_API_KEY', '')
+    
+    # LLM completion budgets per endpoint (tokens reserved for the answer)
+    LLM_MAX_TOKENS_SEND: int = int(os.getenv('LLM_MAX_TOKENS_SEND', '512'))
+    LLM_MAX_TOKENS_SEND_WITH_AI: int = int(os.getenv('LLM_MAX_TOKENS_SEND_WITH_AI', '768'))
+    LLM_MAX_TOKENS_WEBSOCKET: int = int(os.getenv('LLM_MAX_TOKENS_WEBSOCKET', '512'))
+    # Fail fast instead of waiting on the client's default timeout and retries
+    LLM_TIMEOUT: float = float(os.getenv('LLM_TIMEOUT', '30'))
+    LLM_MAX_RETRIES: int = int(os.getenv('LLM_MAX_RETRIES', '1'))
+    
+    # WebSocket connection settings
+    WS_HEARTBEAT_INTERVAL: float = float(os.getenv('WS_HEARTBEAT_INTERVAL', '30'))
+    WS_IDLE_TIMEOUT: float = float(os.getenv('WS_IDLE_TIMEOUT', '600'))
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv('WS_SEND_QUEUE_SIZE', '32'))
+    WS_SEND_TIMEOUT: float = float(os.getenv('WS_SEND_TIMEOUT', '10'))
+    # Chat messages a connection may have queued or in progress; they are answered in order
+    WS_MAX_PENDING: int = int(os.getenv('WS_MAX_PENDING', '3'))
+    # Application-level {"type": "ping"} frames; off by default since clients must ignore them
+    WS_SEND_PINGS: bool = os.getenv('WS_SEND_PINGS', 'false').lower() == 'true'
 
 settings = Settings()
\ No newline at end of file
@@ -1,62 +1,77 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import chat
+from app.routers import chat, debug
 from app.core.config import settings
-from app.services.weaviate_service import WeaviateService
 from app.services.chat_service import ChatService, chat_service
-import os
+from app.services.together_ai_service import together_ai_service
+from app.services.connection_manager import connection_manager
+from app.services.conversation_store import ConversationStore
+from app.services.corpus_service import corpus_registry
+from app.services.profiler import request_profiler
+from app.services.load_monitor import load_monitor, FULL
+from app.services.chat_engine import chat_engine
+from app.services.warmup import warmup_runner
 from contextlib import asynccontextmanager
 
 # Global service instances
 weaviate_service = None
+conversation_store = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handler for startup and shutdown"""
-    global weaviate_service
+    global weaviate_service, conversation_store
     
     # Startup
     print("Starting up AI Chat API...")
     
-    # Initialize Weaviate service
-    weaviate_service = WeaviateService()
-    
-    # Define file paths
-    chunks_file_path = os.path.join("app", "static", "chunks.txt")
-    vectors_file_path = os.path.join("app", "static", "vectors.txt")
-    
-    # Check if files exist
-    if not os.path.exists(chunks_file_path) or not os.path.exists(vectors_file_path):
-        print(f"Warning: Data files not found at {chunks_file_path} or {vectors_file_path}")
-    else:
-        # Initialize collection and load data if needed
-        success = weaviate_service.initialize_collection(
-            chunks_file_path=chunks_file_path,
-            vectors_file_path=vectors_file_path,
-        #     max_chunks=3  # Limit to 3 chunks for testing, remove this for full dataset
+    # Restore conversations lazily from the write-behind store
+    if settings.CHAT_PERSISTENCE_ENABLED:
+        conversation_store = ConversationStore(
+            settings.CHAT_DB_PATH,
+            flush_interval=settings.CHAT_FLUSH_INTERVAL,
+            batch_size=settings.CHAT_FLUSH_BATCH_SIZE,
         )
+        try:
+            await conversation_store.start()
+            chat_service.store = conversation_store
+        except Exception as e:
+            print(f"Failed to open conversation store, history will not persist: {e}")
+            conversation_store = None
+    
+    # Load the default corpus eagerly; other corpora load on first use
+    default_corpus = corpus_registry.get()
+    if await corpus_registry.ensure_ready():
+        weaviate_service = default_corpus.weaviate_service
         
-        if success:
-            print("Weaviate collection initialized successfully")
-            
-            # Initialize chat service with Weaviate service
-            chat_service.weaviate_service = weaviate_service
-            print("Chat service initialized with Weaviate integration")
-        else:
-            print("Failed to initialize Weaviate collection")
+        # Initialize chat service with the default corpus's search service
+        chat_service.weaviate_service = weaviate_service
+        print(f"Chat service initialized with corpus '{default_corpus.name}'")
+    else:
+        weaviate_service = default_corpus.weaviate_service
+        print(f"Failed to initialize corpus '{default_corpus.name}'")
+    
+    # Fill the caches in the background; requests are served meanwhile
+    warmup_runner.start(chat_engine, conversation_store)
     
     yield
     
     # Shutdown
     print("Shutting down AI Chat API...")
-    if weaviate_service:
-        weaviate_service.close()
-        print("Weaviate connection closed")
+    await warmup_runner.stop()
+    await connection_manager.shutdown()
+    if conversation_store:
+        chat_service.store = None
+        await conversation_store.close()
+    corpus_registry.close()
+    print("Weaviate connections closed")
 
 app = FastAPI(
     title="AI Chat API",
     version="1.0.0",
     description="A minimalistic AI chatbot API",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -69,8 +84,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def profile_request(request: Request, call_next):
+    """Profile requests that opt in with an X-Profile header or profile query flag"""
+    if request.headers.get("x-profile") != "1" and request.query_params.get("profile") != "1":
+        return await call_next(request)
+    
+    profile, token, profiler, started = request_profiler.start(request.url.path)
+    try:
+        response = await call_next(request)
+    finally:
+        request_profiler.finish(profile, token, profiler, started)
+    response.headers["X-Profile-Id"] = profile.id
+    response.headers["Server-Timing"] = profile.server_timing()
+    return response
+
+# Only wrap requests in the profiling middleware when profiling is enabled
+if settings.PROFILING_ENABLED:
+    app.middleware("http")(profile_request)
+
 # Include routers
 app.include_router(chat.router, prefix="/api/v1")
+app.include_router(debug.router)
 
 @app.get("/")
 async def root():
@@ -81,12 +115,17 @@ async def health_check():
     global weaviate_service
     weaviate_status = "connected" if weaviate_service and weaviate_service.client else "disconnected"
     chat_status = "ready" if chat_service and chat_service.weaviate_service else "not_initialized"
+    load = load_monitor.status()
     
     return {
-        "status": "healthy",
+        "status": "healthy" if load["tier"] == FULL else "degraded",
         "version": "1.0.0",
         "weaviate": weaviate_status,
-        "chat_service": chat_status
+        "chat_service": chat_status,
+        "corpora": corpus_registry.describe(),
+        "load": load,
+        "warmup": warmup_runner.status(),
+        "llm_usage": together_ai_service.usage_totals
     }
 
 @app.get("/weaviate/status")
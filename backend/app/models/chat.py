@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union
 from datetime import datetime
 
 class ChatMessage(BaseModel):
@@ -13,10 +13,21 @@ class ChatResponse(BaseModel):
     message: str
     timestamp: str
     is_user: bool = False
+    # Prompt/completion token counts for the LLM call that produced this message
+    usage: Optional[Dict[str, int]] = None
 
 class ChatSession(BaseModel):
     session_id: str
-    messages: List[ChatMessage] = []
+    # Corpus the session is bound to; set by its first message
+    corpus: Optional[str] = None
+    # Sessions hold both user messages and AI responses
+    messages: List[Union[ChatMessage, ChatResponse]] = []
+
+class ChatHistoryPage(ChatSession):
+    # True when more messages exist beyond this page in the paging direction
+    has_more: bool = False
 
 class ChatRequest(BaseModel):
-    message: str = Field(..., min_length=1, max_length=1000)
\ No newline at end of file
+    message: str = Field(..., min_length=1, max_length=1000)
+    # Knowledge base to answer from; defaults to the session's corpus
+    corpus: Optional[str] = None
\ No newline at end of file
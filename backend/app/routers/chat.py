@@ -1,96 +1,157 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from typing import List, Dict
-from app.models.chat import ChatRequest, ChatResponse, ChatSession
+from fastapi import APIRouter, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from typing import Optional
+from email.utils import formatdate, parsedate_to_datetime
+from app.core.config import settings
+from app.models.chat import ChatRequest, ChatResponse, ChatHistoryPage
 from app.services.chat_service import chat_service
-from app.services.ai_service import ai_service
-import json
+from app.services.chat_engine import chat_engine
+from app.services.request_coalescer import request_coalescer
+from app.services.connection_manager import Connection, connection_manager
+from app.services.corpus_service import corpus_registry
+from app.services.rate_limiter import rate_limiter, client_ip_from
+from app.services.load_monitor import ServiceUnavailableError
+import math
+import asyncio
+import functools
+import orjson
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-class ConnectionManager:
-    def __init__(self):
-        # Map WebSocket connections to their session IDs
-        self.connection_sessions: Dict[WebSocket, str] = {}
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket, session_id: str):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        self.connection_sessions[websocket] = session_id
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if websocket in self.connection_sessions:
-            del self.connection_sessions[websocket]
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-    
-    def get_session_id(self, websocket: WebSocket) -> str:
-        """Get the session ID associated with a WebSocket connection"""
-        return self.connection_sessions.get(websocket, "default")
-    
-    def get_active_sessions(self) -> Dict[str, int]:
-        """Get a count of active connections per session"""
-        session_counts = {}
-        for session_id in self.connection_sessions.values():
-            session_counts[session_id] = session_counts.get(session_id, 0) + 1
-        return session_counts
+manager = connection_manager
+
+async def _check_rate_limit(http_request: Request, session_id: str, message: str, max_tokens: int):
+    retry_after = await rate_limiter.check(session_id, client_ip_from(http_request), message, max_tokens)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+def _unavailable(e: ServiceUnavailableError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
 
-manager = ConnectionManager()
+def _check_corpus(corpus: Optional[str]):
+    if corpus is not None and corpus_registry.get(corpus) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown corpus: {corpus}")
 
 @router.post("/send", response_model=ChatResponse)
-async def send_message(request: ChatRequest, session_id: str = "default"):
+async def send_message(request: ChatRequest, http_request: Request, session_id: str = "default"):
     """Send a message and get AI response with Weaviate context"""
+    _check_corpus(request.corpus)
+    await _check_rate_limit(http_request, session_id, request.message, settings.LLM_MAX_TOKENS_SEND)
     try:
         if not chat_service:
             raise HTTPException(status_code=503, detail="Chat service not initialized")
         
         # Generate response with context from Weaviate
-        ai_response = await chat_service.generate_response_with_context(session_id, request.message)
+        ai_response = await chat_engine.run(
+            session_id, request.message, max_tokens=settings.LLM_MAX_TOKENS_SEND,
+            corpus=request.corpus, endpoint="send"
+        )
         
         return ai_response
         
+    except ServiceUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/send-with-ai", response_model=ChatResponse)
-async def send_message_with_ai(request: ChatRequest, session_id: str = "default"):
+async def send_message_with_ai(request: ChatRequest, http_request: Request, session_id: str = "default"):
     """Send a message and get AI response using the AI service with conversation history"""
+    _check_corpus(request.corpus)
+    await _check_rate_limit(http_request, session_id, request.message, settings.LLM_MAX_TOKENS_SEND_WITH_AI)
     try:
         if not chat_service:
             raise HTTPException(status_code=503, detail="Chat service not initialized")
         
-        # Get conversation history (up to 5 messages)
-        session = chat_service.get_session(session_id)
-        conversation_history = chat_service._get_conversation_history(session, max_messages=5)
-        
-        # Add user message to session
-        user_msg = chat_service.add_user_message(session_id, request.message)
-        
-        # Query context
-        context = await ai_service.query_context(request.message, limit=3)
-        
-        # Generate AI response with conversation history
-        ai_response_text = await ai_service.generate_response_with_history(
-            request.message, context, conversation_history
+        # Same pipeline as /send, with the larger answer budget
+        ai_response = await chat_engine.run(
+            session_id, request.message, max_tokens=settings.LLM_MAX_TOKENS_SEND_WITH_AI,
+            corpus=request.corpus, endpoint="send-with-ai"
         )
         
-        # Create AI response
-        ai_response = chat_service.add_ai_response(session_id, ai_response_text)
-        
         return ai_response
         
+    except ServiceUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/history/{session_id}", response_model=ChatSession)
-async def get_chat_history(session_id: str):
-    """Get chat history for a session"""
+def _history_response(
+    request: Request, session_id: str, before: Optional[str], after: Optional[str], limit: Optional[int]
+) -> Response:
+    """Serve a history window, or 304 if the client's copy of the session is current"""
+    # Restore the session first so the validators reflect any persisted messages
+    session = chat_service.get_session(session_id)
+    etag, modified_at = chat_service.get_history_validators(session_id)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if modified_at:
+        headers["Last-Modified"] = formatdate(modified_at, usegmt=True)
+    
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since and modified_at:
+        # HTTP dates have whole-second precision, so a change later in the same
+        # second as the client's copy must not count as "not modified". Compare
+        # the exact time strictly; the ETag is the precise validator.
+        try:
+            if modified_at < parsedate_to_datetime(if_modified_since).timestamp():
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+    
+    page = chat_service.get_history_page(session_id, before=before, after=after, limit=limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Message not found in session")
+    messages, has_more = page
+    
+    # Stored messages were validated when they were created; serialise them
+    # straight to JSON instead of letting FastAPI re-validate the whole session
+    body = ChatHistoryPage.model_construct(
+        session_id=session_id,
+        corpus=session.corpus,
+        messages=messages,
+        has_more=has_more
+    )
+    return Response(content=body.model_dump_json(), media_type="application/json", headers=headers)
+
+@router.get("/history/{session_id}", response_model=ChatHistoryPage)
+async def get_chat_history(
+    request: Request,
+    session_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+):
+    """
+    Get chat history for a session. Without parameters returns every message;
+    `before`/`after` take a message id as cursor and `limit` caps the page size.
+    """
     if not chat_service:
         raise HTTPException(status_code=503, detail="Chat service not initialized")
-    return chat_service.get_session_history(session_id)
+    return _history_response(request, session_id, before, after, limit)
+
+@router.get("/history/{session_id}/since/{message_id}", response_model=ChatHistoryPage)
+async def get_chat_history_delta(
+    request: Request,
+    session_id: str,
+    message_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+):
+    """Get only the messages added to a session after the given message id"""
+    if not chat_service:
+        raise HTTPException(status_code=503, detail="Chat service not initialized")
+    return _history_response(request, session_id, None, message_id, limit)
 
 @router.delete("/clear/{session_id}")
 async def clear_chat_history(session_id: str):
@@ -102,57 +163,112 @@ async def clear_chat_history(session_id: str):
         raise HTTPException(status_code=404, detail="Session not found")
     return {"message": f"Chat history cleared for session {session_id}"}
 
+def _encode(payload: dict) -> str:
+    """Encode a small control/error payload for a WebSocket text frame"""
+    return orjson.dumps(payload).decode()
+
+async def _generate_and_send(connection: Connection, request: ChatRequest):
+    """Generate a reply for one WebSocket message and queue it for sending"""
+    try:
+        ai_response = await chat_engine.run(
+            connection.session_id, request.message, max_tokens=settings.LLM_MAX_TOKENS_WEBSOCKET,
+            corpus=request.corpus, endpoint="websocket"
+        )
+        await manager.send(connection, ai_response.model_dump_json())
+    except ServiceUnavailableError as e:
+        await manager.send(connection, _encode({"error": str(e), "retry_after": math.ceil(e.retry_after)}))
+    except asyncio.CancelledError:
+        print(f"Cancelled generation for disconnected session: {connection.session_id}")
+        raise
+    except Exception as e:
+        print(f"Error generating WebSocket response: {e}")
+        await manager.send(connection, _encode({"error": "Failed to generate response"}))
+
 @router.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     """WebSocket endpoint for real-time chat with Weaviate context"""
-    await manager.connect(websocket, session_id)
+    connection = await manager.connect(websocket, session_id)
     print(f"WebSocket connected for session: {session_id}")
     
     try:
         while True:
-            # Receive message from client
+            # Receive message from client; replies are generated one at a time by
+            # the connection's worker so the socket keeps being read meanwhile
             data = await websocket.receive_text()
-            message_data = json.loads(data)
+            manager.touch(connection)
             
-            # Process message
-            request = ChatRequest(**message_data)
+            try:
+                # Chat messages are validated straight from the raw frame; only
+                # frames that are not chat messages get parsed a second time
+                request = ChatRequest.model_validate_json(data)
+            except ValidationError as e:
+                try:
+                    message_data = orjson.loads(data)
+                except orjson.JSONDecodeError:
+                    message_data = None
+                if isinstance(message_data, dict) and message_data.get("type") == "ping":
+                    await manager.send(connection, _encode({"type": "pong"}))
+                else:
+                    await manager.send(connection, _encode({"error": f"Invalid message: {e}"}))
+                continue
             
             if not chat_service:
-                await manager.send_personal_message(
-                    json.dumps({"error": "Chat service not initialized"}), websocket
-                )
+                await manager.send(connection, _encode({"error": "Chat service not initialized"}))
                 continue
             
-            # Get the session ID associated with this WebSocket connection
-            connection_session_id = manager.get_session_id(websocket)
-            
-            # Validate that the session ID matches (security check)
-            if connection_session_id != session_id:
-                print(f"Session ID mismatch: URL={session_id}, Connection={connection_session_id}")
-                await manager.send_personal_message(
-                    json.dumps({"error": "Session ID mismatch"}), websocket
-                )
+            if request.corpus is not None and corpus_registry.get(request.corpus) is None:
+                await manager.send(connection, _encode({"error": f"Unknown corpus: {request.corpus}"}))
                 continue
             
-            print(f"Processing message for session: {connection_session_id}")
+            print(f"Processing message for session: {connection.session_id}")
             
-            # Generate response with context from Weaviate using the connection's session
-            ai_response = await chat_service.generate_response_with_context(connection_session_id, request.message)
-            
-            # Send AI response
-            await manager.send_personal_message(
-                json.dumps(ai_response.model_dump()), websocket
+            retry_after = await rate_limiter.check(
+                connection.session_id, client_ip_from(websocket), request.message, settings.LLM_MAX_TOKENS_WEBSOCKET
             )
+            if retry_after > 0:
+                await manager.send(
+                    connection, _encode({"error": "Rate limit exceeded", "retry_after": math.ceil(retry_after)})
+                )
+                continue
+            
+            if not manager.enqueue_generation(connection, functools.partial(_generate_and_send, connection, request)):
+                await manager.send(
+                    connection, _encode({"error": "Too many messages in progress, please wait"})
+                )
             
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for session: {session_id}")
-        manager.disconnect(websocket)
+    except Exception as e:
+        print(f"WebSocket error for session {session_id}: {e}")
+    finally:
+        await manager.disconnect(websocket)
+
+@router.get("/corpora")
+async def list_corpora():
+    """List the knowledge bases this server can answer from"""
+    return {
+        "default": corpus_registry.default_name,
+        "corpora": corpus_registry.describe()
+    }
 
 @router.get("/debug/sessions")
 async def get_active_sessions():
     """Debug endpoint to see active WebSocket sessions"""
     return {
-        "active_connections": len(manager.active_connections),
+        "active_connections": len(manager.connections),
         "session_counts": manager.get_active_sessions(),
-        "total_sessions": len(manager.connection_sessions)
-    }
\ No newline at end of file
+        "total_sessions": len(manager.session_counts)
+    }
+
+@router.get("/debug/coalescing")
+async def get_coalescing_stats():
+    """Debug endpoint to see how much work identical in-flight requests shared"""
+    return {
+        "in_flight": len(request_coalescer.inflight),
+        "stages": request_coalescer.stats
+    }
+
+@router.get("/debug/engine")
+async def get_engine_stats():
+    """Debug endpoint for the chat pipeline's request counts, stage latencies and cache hit rates"""
+    return chat_engine.stats()
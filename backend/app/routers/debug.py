@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.core.config import settings
+from app.services.profiler import request_profiler, stack_sampler
+
+def _require_profiling():
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(_require_profiling)])
+
+@router.get("/profiles")
+async def list_profiles():
+    """List recently captured request profiles, newest first"""
+    return {"profiles": request_profiler.summaries()}
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """Get stage timings and the cProfile report for one profiled request"""
+    profile = request_profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.to_dict()
+
+@router.post("/sampler/start")
+async def start_sampler(interval_ms: float = Query(10.0, ge=1.0, le=1000.0), reset: bool = True):
+    """Start the continuous stack sampler"""
+    started = stack_sampler.start(interval=interval_ms / 1000, reset=reset)
+    return {"started": started, **stack_sampler.status()}
+
+@router.post("/sampler/stop")
+async def stop_sampler():
+    """Stop the continuous stack sampler, keeping its samples"""
+    stopped = stack_sampler.stop()
+    return {"stopped": stopped, **stack_sampler.status()}
+
+@router.get("/sampler")
+async def get_sampler(limit: int = Query(25, ge=1, le=500)):
+    """Sampler status and the most frequently seen stacks"""
+    return {**stack_sampler.status(), "top_stacks": stack_sampler.top(limit)}
+
+@router.get("/sampler/collapsed", response_class=PlainTextResponse)
+async def get_sampler_collapsed():
+    """All sampled stacks in collapsed format, for flamegraph.pl or speedscope"""
+    return stack_sampler.collapsed()
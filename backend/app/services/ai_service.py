@@ -1,76 +1,39 @@
 import asyncio
-from typing import List, Dict
+from typing import List, Dict, Any
 from .together_ai_service import together_ai_service
 
+# Kept byte-for-byte identical across turns and endpoints so the provider can
+# cache the prompt prefix; anything per-request goes after it.
+SYSTEM_PROMPT = "You are a wise prophet. Provide philosophical debate responses based on the context provided and the user's question. Consider the conversation history to maintain context and continuity. Ask follow up questions sometimes if it makes sense. Do not at any time let the user know you are using a context, just use it to answer the user's question."
+
+DEFAULT_MAX_TOKENS = 512
+
 class AIService:
-    async def generate_response(self, message: str, context: str = None) -> str:
+    def build_messages(self, message: str, context: str = None, conversation_history: List[Dict[str, str]] = None, system_prompt: str = SYSTEM_PROMPT) -> List[Dict[str, str]]:
         """
-        Generate AI response using TogetherAI LLM with optional context.
+        Build chat messages ordered as system prompt, prior turns, current question.
+        The retrieved context is attached to the current question only, so the
+        system prompt and the start of the history window (which only moves in
+        whole-turn steps) stay unchanged across consecutive turns.
         """
-        try:
-            # Prepare system prompt with context if available
-            system_prompt = "You are a wise prophet. Provide philosophical debate responses based on the context provided and the user's question. Ask follow up questins sometimes if it makes sense. Do not at any time let the user know you are using a context, just use it to answer the user's question."
+        messages = [{"role": "system", "content": system_prompt}]
 
-            # Create the user prompt
-            user_prompt = message
-            if context:
-                user_prompt += f"\n\nUse the following context to enrich the response to the user's message:\n{context} do not at any time let the user know you are using a context, just use it to answer the user's question."
-            
-            # Call TogetherAI LLM
-            response = together_ai_service.call_llm(user_prompt, system_prompt)
-            
-            return response
-            
-        except Exception as e:
-            print(f"Error generating AI response: {e}")
-            return f"Developer fucked up."
-    
-    async def generate_response_with_history(self, message: str, context: str = None, conversation_history: str = None) -> str:
-        """
-        Generate AI response using TogetherAI LLM with optional context and conversation history.
-        """
-        try:
-            # Prepare system prompt
-            system_prompt = "You are a wise prophet. Provide philosophical debate responses based on the context provided and the user's question. Consider the conversation history to maintain context and continuity. Ask follow up questions sometimes if it makes sense. Do not at any time let the user know you are using a context, just use it to answer the user's question."
+        if conversation_history:
+            messages.extend(conversation_history)
+
+        user_prompt = message
+        if context:
+            user_prompt += f"\n\nUse the following context to enrich the response to the user's message:\n{context} do not at any time let the user know you are using a context, just use it to answer the user's question."
+        messages.append({"role": "user", "content": user_prompt})
+
+        return messages
 
-            # Create the user prompt with conversation history and context
-            user_prompt = message
-            
-            # Add conversation history if available
-            if conversation_history:
-                user_prompt = f"{conversation_history}\n\nCurrent question: {message}"
-            
-            # Add context if available
-            if context:
-                user_prompt += f"\n\nUse the following context to enrich the response to the user's message:\n{context} do not at any time let the user know you are using a context, just use it to answer the user's question."
-            
-            # Call TogetherAI LLM
-            response = together_ai_service.call_llm(user_prompt, system_prompt)
-            
-            return response
-            
-        except Exception as e:
-            print(f"Error generating AI response with history: {e}")
-            return f"Developer fucked up."
-    
-    async def query_context(self, query: str, limit: int = 5) -> List[Dict]:
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int = DEFAULT_MAX_TOKENS) -> Dict[str, Any]:
         """
-        Query context using Weaviate vector search with TogetherAI embeddings.
+        Generate AI response and token usage using TogetherAI chat completions.
+        Raises RuntimeError if the LLM call fails.
         """
-        try:
-            from .weaviate_service import weaviate_service
-            
-            # Search for similar chunks using vector similarity
-            similar_chunks = weaviate_service.search_similar_chunks(query, limit)
-            # Convert to the expected format
-            context_results = ""
-            for chunk in similar_chunks:
-                context_results += chunk.get('chunk', '') + "\n\n"
-            
-            return context_results
-            
-        except Exception as e:
-            print(f"Error querying context: {e}")
-            return []
+        # Run the blocking client call off the event loop
+        return await asyncio.to_thread(together_ai_service.chat_completion, messages, max_tokens)
 
-ai_service = AIService()
\ No newline at end of file
+ai_service = AIService()
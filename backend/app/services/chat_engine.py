@@ -0,0 +1,332 @@
+import asyncio
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.models.chat import ChatResponse
+from .ai_service import ai_service
+from .cache import TTLCache
+from .chat_service import chat_service
+from .corpus_service import corpus_registry
+from .load_monitor import load_monitor, ServiceUnavailableError, FULL, SHED, REDUCED, RETRIEVAL_ONLY
+from .profiler import stage
+from .request_coalescer import request_coalescer, normalize_query
+from .together_ai_service import together_ai_service
+
+EXCERPT_INTRO = "I can't give a full answer right now, but these passages speak to your question:"
+
+
+class EngineMetrics:
+    """Request counts and per-stage latency shared by every chat entry point"""
+
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def timed(self, name: str):
+        """Record a stage's latency in the metrics and in the request profile, if any"""
+        start = time.perf_counter()
+        with stage(name):
+            try:
+                yield
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                stats = self.stages.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                stats["count"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": dict(self.requests),
+            "errors": self.errors,
+            "stages": {
+                name: {
+                    "count": int(stats["count"]),
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 2) if stats["count"] else 0.0,
+                    "max_ms": round(stats["max_ms"], 2),
+                }
+                for name, stats in self.stages.items()
+            },
+        }
+
+
+class CorpusRetriever:
+    """
+    Retrieval stage: embed the query and search the selected corpus.
+    Embeddings and search results are cached and concurrent identical
+    lookups are coalesced; blocking calls run in worker threads.
+    """
+
+    def __init__(self, embedding_cache: TTLCache, retrieval_cache: TTLCache, metrics: EngineMetrics):
+        self.embedding_cache = embedding_cache
+        self.retrieval_cache = retrieval_cache
+        self.metrics = metrics
+
+    async def embed(self, query: str) -> List[float]:
+        # Every corpus uses the same embedding model, so embeddings are shared across them
+        key = normalize_query(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            with self.metrics.timed("embedding"):
+                embedding = await request_coalescer.run(
+                    "embedding", key,
+                    lambda: asyncio.to_thread(together_ai_service.generate_embeddings, query)
+                )
+            # A zero vector means the embedding call failed; don't keep it
+            if any(embedding):
+                self.embedding_cache.set(key, embedding)
+        return embedding
+
+    async def retrieve(self, query: str, corpus_name: str, limit: int = 3) -> List[Dict]:
+        cache_key = (corpus_name, normalize_query(query), limit)
+        cached = self.retrieval_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        weaviate_service = await corpus_registry.ensure_ready(corpus_name)
+        if weaviate_service is None:
+            print(f"Corpus '{corpus_name}' is not available")
+            return []
+
+        query_embedding = await self.embed(query)
+        with self.metrics.timed("retrieval"):
+            results = await request_coalescer.run(
+                "retrieval", cache_key,
+                lambda: asyncio.to_thread(self.search, weaviate_service, query, limit, query_embedding)
+            )
+        if results:
+            self.retrieval_cache.set(cache_key, results)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embedding": self.embedding_cache.stats(),
+            "retrieval": self.retrieval_cache.stats(),
+        }
+
+    @staticmethod
+    def search(weaviate_service, query: str, limit: int, query_embedding: List[float]) -> List[Dict]:
+        """Search one corpus and keep only the fields the prompt needs"""
+        # Ensure weaviate service is connected (not needed for the in-process index)
+        if not weaviate_service.client and weaviate_service.local_index is None:
+            print("Connecting to Weaviate...")
+            if not weaviate_service.connect():
+                print("Failed to connect to Weaviate")
+                return []
+
+        try:
+            results = weaviate_service.search_similar_chunks(query, limit=limit, query_embedding=query_embedding)
+            print(f"Search returned {len(results)} results")
+            return [
+                {"chunk": obj.get("chunk", ""), "chunk_index": obj.get("chunk_index", 0)}
+                for obj in results
+            ]
+        except Exception as e:
+            print(f"Error retrieving context: {e}")
+            return []
+
+
+class ChatEngine:
+    """
+    The single chat pipeline behind /chat/send, /chat/send-with-ai and the
+    WebSocket. Each stage is a replaceable object:
+
+    - retriever: `await retrieve(query, corpus_name, limit) -> List[Dict]` and
+      `stats() -> Dict` for /debug/engine
+    - history: `conversation_history`, `add_user_message`, `add_ai_response`,
+      `remove_message` and `resolve_corpus` (the ChatService session store)
+    - prompt_builder: `build_messages(message, context, history, system_prompt)`
+    - generator: `await complete(messages, max_tokens) -> {"text", "prompt_tokens", "completion_tokens"}`,
+      raising on failure
+
+    The load monitor picks a service tier per turn (see LoadMonitor). The
+    question is recorded when a turn starts, so turns keep their arrival
+    order; if no answer can be produced it is removed again, so failed turns
+    leave nothing (and no error text) in history. Turns of the same session
+    are serialised so each one sees the previous turn in its history. Answers precomputed by warm() are
+    served for matching first turns of a session.
+    """
+
+    def __init__(self, retriever, history, prompt_builder, generator, metrics: EngineMetrics, load=None,
+                 answer_cache: Optional[TTLCache] = None, context_limit: int = 3, history_messages: int = 8,
+                 excerpt_chunks: int = 2, excerpt_chars: int = 600):
+        self.retriever = retriever
+        self.history = history
+        self.prompt_builder = prompt_builder
+        self.generator = generator
+        self.metrics = metrics
+        self.load = load or load_monitor
+        self.answer_cache = answer_cache or TTLCache()
+        # One turn at a time per session; entries go away with their last user
+        self.session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.excerpt_chunks = excerpt_chunks
+        self.excerpt_chars = excerpt_chars
+        self.context_limit = context_limit
+        self.history_messages = history_messages
+
+    async def run(self, session_id: str, message: str, max_tokens: int, corpus: Optional[str] = None,
+                  endpoint: str = "send") -> ChatResponse:
+        """
+        Answer one user turn and record it in the session.
+        Raises ServiceUnavailableError if the turn is shed or cannot be answered.
+        """
+        self.metrics.requests[endpoint] = self.metrics.requests.get(endpoint, 0) + 1
+        tier = self.load.admit()
+        if tier == SHED:
+            self.metrics.errors += 1
+            raise ServiceUnavailableError("Server is overloaded, please retry shortly", self.load.retry_after())
+        lock = self.session_locks.get(session_id)
+        if lock is None:
+            lock = self.session_locks[session_id] = asyncio.Lock()
+        try:
+            # Turns of one session run in arrival order, each seeing the previous one
+            async with lock:
+                return await self._run(session_id, message, max_tokens, corpus, tier)
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        finally:
+            self.load.release()
+
+    async def _run(self, session_id: str, message: str, max_tokens: int, corpus: Optional[str], tier: str) -> ChatResponse:
+        corpus_name = self.history.resolve_corpus(session_id, corpus)
+        system_prompt = corpus_registry.get(corpus_name).system_prompt
+
+        conversation_history = self.history.conversation_history(session_id, max_messages=self.history_messages)
+
+        if not conversation_history:
+            precomputed = self.answer_cache.get((corpus_name, normalize_query(message)))
+            if precomputed is not None:
+                self.history.add_user_message(session_id, message)
+                return self.history.add_ai_response(session_id, precomputed)
+
+        user_msg = self.history.add_user_message(session_id, message)
+        try:
+            text, usage = await self._answer(message, corpus_name, system_prompt, conversation_history, max_tokens, tier)
+        except BaseException:
+            # Includes cancellation when a WebSocket client goes away mid-turn
+            self.history.remove_message(session_id, user_msg.id)
+            raise
+        return self.history.add_ai_response(session_id, text, usage=usage)
+
+    async def _answer(self, message: str, corpus_name: str, system_prompt: str,
+                      conversation_history: List[Dict[str, str]], max_tokens: int, tier: str):
+        """Produce (text, usage) for a turn at the given tier"""
+        context_items = await self.retriever.retrieve(message, corpus_name, self.context_limit)
+        context_text = self._context_text(context_items)
+
+        if tier != RETRIEVAL_ONLY:
+            if tier == REDUCED:
+                max_tokens = min(max_tokens, settings.DEGRADE_MAX_TOKENS)
+            messages = self.prompt_builder.build_messages(message, context_text, conversation_history, system_prompt)
+            try:
+                with self.metrics.timed("llm"):
+                    if conversation_history:
+                        completion = await self._generate(messages, max_tokens)
+                    else:
+                        # Without history the answer depends only on (corpus, query, context),
+                        # so identical questions in flight share one LLM call
+                        completion = await request_coalescer.run(
+                            "completion", (corpus_name, normalize_query(message), context_text, max_tokens),
+                            lambda: self._generate(messages, max_tokens)
+                        )
+                usage = {
+                    "prompt_tokens": completion["prompt_tokens"],
+                    "completion_tokens": completion["completion_tokens"],
+                }
+                return completion["text"], usage
+            except Exception as e:
+                print(f"Chat engine: LLM failed, falling back to excerpts: {e}")
+
+        text = self._excerpt_answer(context_items)
+        if not text:
+            raise ServiceUnavailableError("The assistant is temporarily unavailable, please retry shortly", self.load.retry_after())
+        return text, None
+
+    async def warm(self, query: str, corpus: Optional[str] = None, precompute: bool = False) -> bool:
+        """
+        Fill the embedding and retrieval caches for a query and, with precompute,
+        generate and keep its first-turn answer (at the /chat/send token budget).
+        Returns False if nothing could be cached.
+
+        Answers are only generated while the load monitor is in the full tier,
+        and warm-up calls are not reported to it, so a failing LLM during
+        warm-up cannot degrade service for real traffic.
+        """
+        corpus_name = corpus_registry.resolve_name(corpus)
+        context_items = await self.retriever.retrieve(query, corpus_name, self.context_limit)
+        if not precompute or self.load.current_tier() != FULL:
+            return bool(context_items)
+
+        key = (corpus_name, normalize_query(query))
+        if key in self.answer_cache:
+            return True
+        system_prompt = corpus_registry.get(corpus_name).system_prompt
+        messages = self.prompt_builder.build_messages(query, self._context_text(context_items), None, system_prompt)
+        completion = await self.generator.complete(messages, settings.LLM_MAX_TOKENS_SEND)
+        self.answer_cache.set(key, completion["text"])
+        return True
+
+    @staticmethod
+    def _context_text(context_items: List[Dict]) -> str:
+        return "".join(f"{item.get('chunk', '')}\n\n" for item in context_items)
+
+    async def _generate(self, messages: List[Dict[str, str]], max_tokens: int) -> Dict[str, Any]:
+        """Call the generator and feed its latency or failure to the load monitor"""
+        start = time.perf_counter()
+        try:
+            completion = await self.generator.complete(messages, max_tokens)
+        except Exception:
+            self.load.record_llm_failure()
+            raise
+        self.load.record_llm_success((time.perf_counter() - start) * 1000)
+        return completion
+
+    def _excerpt_answer(self, context_items: List[Dict]) -> str:
+        """Answer from the top retrieved chunks alone, for when the LLM is unavailable"""
+        excerpts = []
+        for item in context_items[:self.excerpt_chunks]:
+            chunk = item.get("chunk", "").strip()
+            if len(chunk) > self.excerpt_chars:
+                chunk = chunk[:self.excerpt_chars].rsplit(" ", 1)[0] + "..."
+            if chunk:
+                excerpts.append(chunk)
+        if not excerpts:
+            return ""
+        return "\n\n".join([EXCERPT_INTRO] + excerpts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics.snapshot(),
+            "caches": {
+                **self.retriever.stats(),
+                "answers": self.answer_cache.stats(),
+            },
+            "coalescing": request_coalescer.stats,
+            "load": self.load.status(),
+        }
+
+
+def create_chat_engine() -> ChatEngine:
+    metrics = EngineMetrics()
+    retriever = CorpusRetriever(
+        embedding_cache=TTLCache(settings.EMBEDDING_CACHE_SIZE, settings.CACHE_TTL_SECONDS),
+        retrieval_cache=TTLCache(settings.RETRIEVAL_CACHE_SIZE, settings.CACHE_TTL_SECONDS),
+        metrics=metrics,
+    )
+    return ChatEngine(
+        retriever=retriever,
+        history=chat_service,
+        prompt_builder=ai_service,
+        generator=ai_service,
+        metrics=metrics,
+        answer_cache=TTLCache(settings.ANSWER_CACHE_SIZE, settings.ANSWER_CACHE_TTL_SECONDS),
+    )
+
+
+# Create a global instance
+chat_engine = create_chat_engine()
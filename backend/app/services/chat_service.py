@@ -1,14 +1,29 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
+from collections import OrderedDict
 from datetime import datetime
 import uuid
-import asyncio
+import time
+from app.core.config import settings
 from app.models.chat import ChatMessage, ChatResponse, ChatSession
-from .ai_service import ai_service
+from .corpus_service import corpus_registry
 
 class ChatService:
     def __init__(self, weaviate_service=None):
-        self.sessions: Dict[str, ChatSession] = {}
+        # Sessions in least-recently-used order; with a store attached the
+        # least recently used are evicted and restored from it when needed
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        # Sessions whose older messages are still only in the store
+        self.partial_sessions: set = set()
         self.weaviate_service = weaviate_service
+        # Message id -> position in the session, so history cursors resolve in O(1)
+        self.message_positions: Dict[str, Dict[str, int]] = {}
+        # Per-session change counter and last change time for ETag/Last-Modified.
+        # The epoch keeps ETags from a previous process from matching after a restart.
+        self.versions: Dict[str, int] = {}
+        self.modified_at: Dict[str, float] = {}
+        self.epoch = uuid.uuid4().hex[:8]
+        # Optional ConversationStore, attached at startup
+        self.store = None
         
         # If no weaviate service provided, try to initialize one
         if not self.weaviate_service:
@@ -22,9 +37,76 @@ class ChatService:
     
     def get_session(self, session_id: str) -> ChatSession:
         if session_id not in self.sessions:
-            self.sessions[session_id] = ChatSession(session_id=session_id, messages=[])
+            self.sessions[session_id] = self._restore_session(session_id)
+            self._evict_sessions()
+        else:
+            self.sessions.move_to_end(session_id)
         return self.sessions[session_id]
     
+    def _evict_sessions(self):
+        """Drop the least recently used sessions from memory; they stay in the store"""
+        if not self.store:
+            return
+        while len(self.sessions) > max(1, settings.MAX_CACHED_SESSIONS):
+            session_id, _ = self.sessions.popitem(last=False)
+            self.message_positions.pop(session_id, None)
+            self.partial_sessions.discard(session_id)
+    
+    def _restore_session(self, session_id: str) -> ChatSession:
+        """Build a session from the most recent persisted messages, if any"""
+        session = ChatSession(session_id=session_id, messages=[])
+        if not self.store:
+            return session
+        
+        corpus = self.store.load_corpus(session_id)
+        # A corpus removed from the config since then falls back to the default
+        if corpus is not None and corpus_registry.get(corpus) is not None:
+            session.corpus = corpus
+        rows = self.store.load_recent(session_id, settings.MAX_MESSAGES_PER_SESSION)
+        session.messages = [self._message_from_row(row) for row in rows]
+        self.message_positions[session_id] = {msg.id: i for i, msg in enumerate(session.messages)}
+        if len(rows) >= settings.MAX_MESSAGES_PER_SESSION:
+            # Older messages may exist; get_history_page loads them on demand
+            self.partial_sessions.add(session_id)
+        # A session evicted earlier keeps its version, so its validators still match
+        if session.messages and session_id not in self.versions:
+            self._mark_modified(session_id)
+        return session
+    
+    @staticmethod
+    def _message_from_row(row: Dict) -> Union[ChatMessage, ChatResponse]:
+        # Rows were validated before they were stored
+        if row["is_user"]:
+            row.pop("usage")
+            return ChatMessage.model_construct(**row)
+        return ChatResponse.model_construct(**row)
+    
+    def _load_older(self, session_id: str, limit: Optional[int] = None) -> int:
+        """Prepend up to `limit` (all if None) stored messages older than the session's window"""
+        session = self.sessions[session_id]
+        if session_id not in self.partial_sessions or not session.messages:
+            self.partial_sessions.discard(session_id)
+            return 0
+        rows = self.store.load_before(session_id, session.messages[0].id, limit)
+        if limit is None or len(rows) < limit:
+            self.partial_sessions.discard(session_id)
+        if rows:
+            session.messages[:0] = [self._message_from_row(row) for row in rows]
+            self.message_positions[session_id] = {msg.id: i for i, msg in enumerate(session.messages)}
+        return len(rows)
+    
+    def _append_message(self, session: ChatSession, message: Union[ChatMessage, ChatResponse]):
+        positions = self.message_positions.setdefault(session.session_id, {})
+        positions[message.id] = len(session.messages)
+        session.messages.append(message)
+        self._mark_modified(session.session_id)
+        if self.store:
+            self.store.append(session.session_id, message)
+    
+    def _mark_modified(self, session_id: str):
+        self.versions[session_id] = self.versions.get(session_id, 0) + 1
+        self.modified_at[session_id] = time.time()
+    
     def add_user_message(self, session_id: str, message: str) -> ChatMessage:
         session = self.get_session(session_id)
         user_msg = ChatMessage(
@@ -33,104 +115,146 @@ class ChatService:
             timestamp=datetime.now().isoformat(),
             is_user=True
         )
-        session.messages.append(user_msg)
+        self._append_message(session, user_msg)
         return user_msg
     
-    def get_relevant_context(self, query: str, limit: int = 3) -> List[Dict]:
-        """Get relevant context from Weaviate knowledge base"""
-        if not self.weaviate_service:
-            print("Weaviate service not available")
-            return []
-        
-        # Ensure weaviate service is connected
-        if not self.weaviate_service.client:
-            print("Connecting to Weaviate...")
-            if not self.weaviate_service.connect():
-                print("Failed to connect to Weaviate")
-                return []
-        
-        try:
-            # Search for similar chunks
-            results = self.weaviate_service.search_similar_chunks(query, limit=limit)
-            print(f"Search returned {len(results)} results")
-            
-            # Format results for response
-            context = []
-            for obj in results:
-                context.append({
-                    "chunk": obj.get("chunk", ""),
-                    "chunk_index": obj.get("chunk_index", 0)
-                })
-            
-            print(f"Formatted {len(context)} context items")
-            return context
-        except Exception as e:
-            print(f"Error retrieving context: {e}")
-            return []
+    def resolve_corpus(self, session_id: str, requested: Optional[str] = None) -> str:
+        """
+        Pick the corpus for a turn: the requested one, else the session's, else
+        the default. A session is bound to the first corpus it uses.
+        """
+        session = self.get_session(session_id)
+        if requested is not None and corpus_registry.get(requested) is None:
+            raise ValueError(f"Unknown corpus: {requested}")
+        corpus_name = requested or session.corpus or corpus_registry.default_name
+        if session.corpus is None:
+            session.corpus = corpus_name
+            if self.store:
+                self.store.bind_corpus(session_id, corpus_name)
+        return corpus_name
     
-    def add_ai_response(self, session_id: str, message: str) -> ChatResponse:
+    def add_ai_response(self, session_id: str, message: str, usage: Optional[Dict[str, int]] = None) -> ChatResponse:
         session = self.get_session(session_id)
         ai_response = ChatResponse(
             id=f"ai_{uuid.uuid4().hex[:8]}",
             message=message,
             timestamp=datetime.now().isoformat(),
             is_user=False,
+            usage=usage,
         )
-        session.messages.append(ai_response)
+        self._append_message(session, ai_response)
         return ai_response
     
-    async def generate_response_with_context(self, session_id: str, user_message: str) -> ChatResponse:
-        """Generate AI response with relevant context from Weaviate using TogetherAI"""
-        # Get relevant context
-        context_items = self.get_relevant_context(user_message, limit=3)
-        print(f"Chat service: Retrieved {len(context_items)} context items")
-        
-        # Format context as string
-        context_text = ""
-        for item in context_items:
-            context_text += f"{item.get('chunk', '')}\n\n"
-        
-        # Get conversation history (up to 5 messages)
+    def remove_message(self, session_id: str, message_id: str) -> bool:
+        """Remove a message, e.g. the question of a turn that could not be answered"""
         session = self.get_session(session_id)
-        conversation_history = self._get_conversation_history(session, max_messages=5)
-        
-        # Add user message to session
-        self.add_user_message(session_id, user_message)
-        
-        # Generate AI response using the AI service with conversation history
-        response_message = await ai_service.generate_response_with_history(
-            user_message, context_text, conversation_history
-        )
-        
-        # Create and add AI response
-        ai_response = self.add_ai_response(session_id, response_message)
-        print(f"Chat service: Created AI response")
-        
-        return ai_response
+        positions = self.message_positions.get(session_id, {})
+        index = positions.get(message_id)
+        if index is None:
+            return False
+        del session.messages[index]
+        # Later messages moved up by one
+        self.message_positions[session_id] = {msg.id: i for i, msg in enumerate(session.messages)}
+        self._mark_modified(session_id)
+        if self.store:
+            self.store.delete(session_id, message_id)
+        return True
+    
+    def conversation_history(self, session_id: str, max_messages: int = 8) -> List[Dict[str, str]]:
+        """Get a session's recent turns as role/content chat messages, oldest first"""
+        return self._get_conversation_history(self.get_session(session_id), max_messages=max_messages)
     
-    def _get_conversation_history(self, session: ChatSession, max_messages: int = 5) -> str:
-        """Get formatted conversation history for context"""
+    def _get_conversation_history(self, session: ChatSession, max_messages: int = 8) -> List[Dict[str, str]]:
+        """
+        Get conversation history as chat messages, oldest first.
+        
+        Instead of sliding by one message every turn, the window grows turn by
+        turn up to max_messages and then restarts from the last full turn, so
+        the same messages open the prompt for several consecutive turns and the
+        provider can reuse the cached prefix.
+        """
         if not session.messages:
-            return ""
+            return []
         
-        # Get the last max_messages from the conversation
-        recent_messages = session.messages[-max_messages:]
+        count = len(session.messages)
+        # Restart in whole turns (user + assistant pairs), keeping the last turn
+        step = max(2, (max_messages - 2) // 2 * 2)
+        start = 0
+        if count > max_messages:
+            start = -(-(count - max_messages) // step) * step
+        recent_messages = session.messages[start:]
         
-        history_text = "Previous conversation:\n"
-        for msg in recent_messages:
-            role = "User" if msg.is_user else "Assistant"
-            history_text += f"{role}: {msg.message}\n"
+        # Never open the history on an assistant reply (e.g. after a restore)
+        while recent_messages and not recent_messages[0].is_user:
+            recent_messages = recent_messages[1:]
         
-        return history_text
+        return [
+            {"role": "user" if msg.is_user else "assistant", "content": msg.message}
+            for msg in recent_messages
+        ]
     
     def clear_session(self, session_id: str) -> bool:
-        if session_id in self.sessions:
+        if session_id in self.sessions or (self.store and self.get_session(session_id).messages):
             self.sessions[session_id].messages.clear()
+            self.message_positions.pop(session_id, None)
+            self.partial_sessions.discard(session_id)
+            self._mark_modified(session_id)
+            if self.store:
+                self.store.clear(session_id)
             return True
         return False
     
     def get_session_history(self, session_id: str) -> ChatSession:
         return self.get_session(session_id)
+    
+    def get_history_page(
+        self, session_id: str, before: str = None, after: str = None, limit: int = None
+    ) -> Optional[Tuple[List[Union[ChatMessage, ChatResponse]], bool]]:
+        """
+        Get a window of a session's messages and whether more exist past it.
+        
+        With `after`, pages forward from just after that message; otherwise
+        pages backward from `before` (or the newest message). Paging back past
+        the messages held in memory loads older ones from the store. Returns
+        None if a cursor does not refer to a message in the session.
+        """
+        self.get_session(session_id)
+        for cursor in (before, after):
+            # A cursor older than the in-memory window: load the rest of the session
+            if cursor is not None and cursor not in self.message_positions.get(session_id, {}):
+                self._load_older(session_id)
+        
+        positions = self.message_positions.get(session_id, {})
+        if (before is not None and before not in positions) or (after is not None and after not in positions):
+            return None
+        
+        if after is None:
+            end = positions[before] if before is not None else len(self.sessions[session_id].messages)
+            # Load one more than needed so has_more is known
+            if limit is None:
+                self._load_older(session_id)
+            elif end - limit <= 0:
+                self._load_older(session_id, limit - end + 1)
+            positions = self.message_positions.get(session_id, {})
+        
+        messages = self.sessions[session_id].messages
+        start, end = 0, len(messages)
+        if before is not None:
+            end = positions[before]
+        if after is not None:
+            start = positions[after] + 1
+        
+        if limit is None or end - start <= limit:
+            return messages[start:end], False
+        if after is not None:
+            return messages[start:start + limit], True
+        return messages[end - limit:end], True
+    
+    def get_history_validators(self, session_id: str) -> Tuple[str, float]:
+        """Get the ETag and last-modified time for a session's history"""
+        version = self.versions.get(session_id, 0)
+        modified_at = self.modified_at.get(session_id, 0.0)
+        return f'W/"{self.epoch}-{version}"', modified_at
 
 # Create a singleton instance
 chat_service = ChatService()
@@ -0,0 +1,186 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from fastapi import WebSocket
+from app.core.config import settings
+
+
+class Connection:
+    """State kept for one accepted WebSocket"""
+
+    def __init__(self, websocket: WebSocket, session_id: str, send_queue_size: int):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.send_queue: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self.last_seen = time.monotonic()
+        # Chat messages waiting for, or being handled by, the worker task
+        self.chat_queue: asyncio.Queue = asyncio.Queue()
+        self.pending = 0
+        self.worker_task: Optional[asyncio.Task] = None
+        self.sender_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+
+class ConnectionManager:
+    """
+    Tracks WebSocket connections in dicts so registration and removal are O(1).
+
+    Each connection gets a bounded send queue drained by its own sender task,
+    so a slow client only ever blocks itself. Chat messages are answered one
+    at a time, in arrival order, by a per-connection worker task that is
+    cancelled when the client goes away, so replies come back in the order
+    the messages were sent and each turn sees the previous one in its history.
+    A single heartbeat task closes connections that have been idle too long.
+    """
+
+    def __init__(
+        self,
+        heartbeat_interval: float = 30.0,
+        idle_timeout: float = 600.0,
+        send_queue_size: int = 32,
+        send_timeout: float = 10.0,
+        max_pending: int = 3,
+        send_pings: bool = False,
+    ):
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.session_counts: Dict[str, int] = {}
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.send_queue_size = send_queue_size
+        self.send_timeout = send_timeout
+        self.max_pending = max_pending
+        self.send_pings = send_pings
+        self.heartbeat_task: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: WebSocket, session_id: str) -> Connection:
+        await websocket.accept()
+        connection = Connection(websocket, session_id, self.send_queue_size)
+        connection.sender_task = asyncio.create_task(self._sender(connection))
+        connection.worker_task = asyncio.create_task(self._worker(connection))
+        self.connections[websocket] = connection
+        self.session_counts[session_id] = self.session_counts.get(session_id, 0) + 1
+
+        if self.heartbeat_task is None or self.heartbeat_task.done():
+            self.heartbeat_task = asyncio.create_task(self._heartbeat())
+        return connection
+
+    async def disconnect(self, websocket: WebSocket, code: int = 1000):
+        """Unregister a connection, cancel its work and close the socket. Safe to call twice."""
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        connection.closed = True
+
+        count = self.session_counts.get(connection.session_id, 0) - 1
+        if count > 0:
+            self.session_counts[connection.session_id] = count
+        else:
+            self.session_counts.pop(connection.session_id, None)
+
+        current = asyncio.current_task()
+        for task in (connection.worker_task, connection.sender_task):
+            if task and task is not current:
+                task.cancel()
+
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            # Already closed by the client or the server
+            pass
+
+    async def send(self, connection: Connection, message: str) -> bool:
+        """
+        Queue a message for the connection. If the client does not drain its
+        queue within send_timeout it is treated as stuck and disconnected.
+        """
+        if connection.closed:
+            return False
+        try:
+            await asyncio.wait_for(connection.send_queue.put(message), timeout=self.send_timeout)
+            return True
+        except asyncio.TimeoutError:
+            print(f"WebSocket send queue full for session {connection.session_id}, closing connection")
+            await self.disconnect(connection.websocket, code=1013)
+            return False
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        connection = self.connections.get(websocket)
+        if connection:
+            await self.send(connection, message)
+
+    def enqueue_generation(self, connection: Connection, handler: Callable[[], Awaitable]) -> bool:
+        """Queue a reply-producing callable for the connection's worker, if under its pending limit"""
+        if connection.pending >= self.max_pending:
+            return False
+        connection.pending += 1
+        connection.chat_queue.put_nowait(handler)
+        return True
+
+    def touch(self, connection: Connection):
+        connection.last_seen = time.monotonic()
+
+    async def _worker(self, connection: Connection):
+        while True:
+            handler = await connection.chat_queue.get()
+            try:
+                await handler()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"WebSocket generation failed for session {connection.session_id}: {e}")
+            finally:
+                connection.pending -= 1
+
+    async def _sender(self, connection: Connection):
+        try:
+            while True:
+                message = await connection.send_queue.get()
+                await connection.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"WebSocket send failed for session {connection.session_id}: {e}")
+            await self.disconnect(connection.websocket, code=1011)
+
+    async def _heartbeat(self):
+        while self.connections:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for connection in list(self.connections.values()):
+                if now - connection.last_seen > self.idle_timeout:
+                    print(f"Closing idle WebSocket for session {connection.session_id}")
+                    await self.disconnect(connection.websocket, code=1001)
+                elif self.send_pings:
+                    try:
+                        connection.send_queue.put_nowait('{"type": "ping"}')
+                    except asyncio.QueueFull:
+                        # The client already has replies waiting; no need to ping it
+                        pass
+
+    async def shutdown(self):
+        """Close every connection, e.g. on application shutdown"""
+        for websocket in list(self.connections):
+            await self.disconnect(websocket, code=1001)
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+
+    def get_session_id(self, websocket: WebSocket) -> str:
+        """Get the session ID associated with a WebSocket connection"""
+        connection = self.connections.get(websocket)
+        return connection.session_id if connection else "default"
+
+    def get_active_sessions(self) -> Dict[str, int]:
+        """Get a count of active connections per session"""
+        return dict(self.session_counts)
+
+
+# Create a global instance
+connection_manager = ConnectionManager(
+    heartbeat_interval=settings.WS_HEARTBEAT_INTERVAL,
+    idle_timeout=settings.WS_IDLE_TIMEOUT,
+    send_queue_size=settings.WS_SEND_QUEUE_SIZE,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+    max_pending=settings.WS_MAX_PENDING,
+    send_pings=settings.WS_SEND_PINGS,
+)
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ConversationStore:
+    """
+    Append-only, write-behind persistence for chat messages in SQLite (WAL mode).
+
+    The request path only appends to an in-memory list; a background task
+    writes pending operations in batches from a worker thread. Sessions are
+    read back lazily, one recent window at a time, when first accessed.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 0.5, batch_size: int = 200):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending: List[Tuple[str, Any]] = []
+        # The batch a worker thread is writing right now (not yet visible to reads)
+        self.writing: List[Tuple[str, Any]] = []
+        self.write_conn: Optional[sqlite3.Connection] = None
+        self.read_conn: Optional[sqlite3.Connection] = None
+        self.flush_task: Optional[asyncio.Task] = None
+        self.flush_lock: Optional[asyncio.Lock] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.closing = False
+
+    def _open(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.write_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.write_conn.execute("PRAGMA journal_mode=WAL")
+        self.write_conn.execute("PRAGMA synchronous=NORMAL")
+        self.write_conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                is_user INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                timestamp TEXT,
+                usage TEXT
+            )
+            """
+        )
+        self.write_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq)"
+        )
+        # The corpus a session is bound to (see ChatService.resolve_corpus)
+        self.write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, corpus TEXT)"
+        )
+        self.write_conn.commit()
+
+        # WAL lets this connection read while the flusher writes on the other one
+        self.read_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+
+    async def start(self):
+        """Open the database and start the background flusher"""
+        await asyncio.to_thread(self._open)
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.flush_task = asyncio.create_task(self._flush_loop())
+        print(f"Conversation store ready at {self.db_path}")
+
+    def append(self, session_id: str, message: Any):
+        """Queue a ChatMessage or ChatResponse for writing"""
+        usage = getattr(message, "usage", None)
+        self.pending.append((
+            "append",
+            (
+                session_id,
+                message.id,
+                1 if message.is_user else 0,
+                message.message,
+                message.timestamp,
+                json.dumps(usage) if usage else None,
+            ),
+        ))
+        if len(self.pending) >= self.batch_size and self.wakeup:
+            self.wakeup.set()
+
+    def bind_corpus(self, session_id: str, corpus: str):
+        """Queue recording the corpus a session is bound to"""
+        self.pending.append(("bind", (session_id, corpus)))
+
+    def delete(self, session_id: str, message_id: str):
+        """Drop a message, whether it is still pending or already written"""
+        for i, (op, payload) in enumerate(self.pending):
+            if op == "append" and payload[0] == session_id and payload[1] == message_id:
+                del self.pending[i]
+                return
+        self.pending.append(("delete", (session_id, message_id)))
+
+    def clear(self, session_id: str):
+        """Queue deletion of a session's stored messages"""
+        self.pending.append(("clear", session_id))
+
+    async def _flush_loop(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write all pending operations in one transaction"""
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            self.writing = batch
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                print(f"Failed to persist {len(batch)} chat operations, will retry: {e}")
+                self.pending = batch + self.pending
+            finally:
+                self.writing = []
+
+    def _write_batch(self, batch: List[Tuple[str, Any]]):
+        with self.write_conn:
+            rows = []
+            for op, payload in batch:
+                if op == "append":
+                    rows.append(payload)
+                    continue
+                if op == "bind":
+                    self.write_conn.execute(
+                        "INSERT OR REPLACE INTO sessions (session_id, corpus) VALUES (?, ?)", payload
+                    )
+                    continue
+                # Keep ordering: write the appends queued before this delete first
+                if rows:
+                    self._insert_rows(rows)
+                    rows = []
+                if op == "delete":
+                    self.write_conn.execute(
+                        "DELETE FROM messages WHERE session_id = ? AND message_id = ?", payload
+                    )
+                else:
+                    self.write_conn.execute("DELETE FROM messages WHERE session_id = ?", (payload,))
+            if rows:
+                self._insert_rows(rows)
+
+    def _insert_rows(self, rows: List[tuple]):
+        self.write_conn.executemany(
+            "INSERT INTO messages (session_id, message_id, is_user, message, timestamp, usage) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def load_recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Load the most recent `limit` messages of a session, oldest first,
+        including operations that are queued but not yet written.
+        """
+        if not self.read_conn:
+            return []
+        cursor = self.read_conn.execute(
+            "SELECT message_id, is_user, message, timestamp, usage FROM messages "
+            "WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit),
+        )
+        rows = [self._row_dict(row) for row in reversed(cursor.fetchall())]
+        return self._apply_unwritten(session_id, rows)[-limit:]
+
+    def load_before(self, session_id: str, message_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Load up to `limit` messages (all if None) stored before the given
+        message, oldest first. Returns [] if that message is not stored yet.
+        """
+        if not self.read_conn:
+            return []
+        cursor = self.read_conn.execute(
+            "SELECT message_id, is_user, message, timestamp, usage FROM messages "
+            "WHERE session_id = ? AND seq < ("
+            "SELECT seq FROM messages WHERE session_id = ? AND message_id = ?"
+            ") ORDER BY seq DESC LIMIT ?",
+            (session_id, session_id, message_id, -1 if limit is None else limit),
+        )
+        return [self._row_dict(row) for row in reversed(cursor.fetchall())]
+
+    def _apply_unwritten(self, session_id: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replay the in-flight and pending operations for a session over rows read from disk"""
+        seen = {row["id"] for row in rows}
+        for op, payload in self.writing + self.pending:
+            if op == "append" and payload[0] == session_id and payload[1] not in seen:
+                _, message_id, is_user, message, timestamp, usage = payload
+                rows.append(self._row_dict((message_id, is_user, message, timestamp, usage)))
+                seen.add(message_id)
+            elif op == "delete" and payload[0] == session_id:
+                rows = [row for row in rows if row["id"] != payload[1]]
+            elif op == "clear" and payload == session_id:
+                rows = []
+        return rows
+
+    @staticmethod
+    def _row_dict(row: tuple) -> Dict[str, Any]:
+        message_id, is_user, message, timestamp, usage = row
+        return {
+            "id": message_id,
+            "is_user": bool(is_user),
+            "message": message,
+            "timestamp": timestamp,
+            "usage": json.loads(usage) if usage else None,
+        }
+
+    def load_corpus(self, session_id: str) -> Optional[str]:
+        """The corpus a stored session is bound to, if any"""
+        if not self.read_conn:
+            return None
+        row = self.read_conn.execute(
+            "SELECT corpus FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def top_user_queries(self, limit: int, max_length: int = 500) -> List[Tuple[str, int]]:
+        """Most frequently asked user messages across all sessions, with their counts"""
+        if not self.read_conn:
+            return []
+        # A separate connection, since this runs in a worker thread while requests read
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(
+                "SELECT lower(trim(message)) AS query, COUNT(*) AS asked FROM messages "
+                "WHERE is_user = 1 AND length(message) <= ? "
+                "GROUP BY query ORDER BY asked DESC LIMIT ?",
+                (max_length, limit),
+            )
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    async def close(self):
+        """Stop the flusher, write anything still pending and close the database"""
+        if self.flush_task:
+            # Let the loop finish its current write rather than cancelling it mid-batch
+            self.closing = True
+            self.wakeup.set()
+            await self.flush_task
+            self.flush_task = None
+        if self.flush_lock:
+            await self.flush()
+        for conn in (self.write_conn, self.read_conn):
+            if conn:
+                conn.close()
+        self.write_conn = None
+        self.read_conn = None
+        print("Conversation store closed")
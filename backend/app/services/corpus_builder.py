@@ -0,0 +1,246 @@
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+SOURCE_EXTENSIONS = (".txt", ".md")
+
+CHUNKS_FILE = "chunks.txt"
+VECTORS_FILE = "vectors.txt"
+MANIFEST_FILE = "manifest.json"
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """Split text into chunks of chunk_size words, consecutive chunks sharing overlap words"""
+    words = text.split()
+    if not words:
+        return []
+    step = chunk_size - overlap
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+def _chunk_file(args) -> List[str]:
+    """Read and chunk one source document (runs in a worker process)"""
+    path, chunk_size, overlap = args
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return chunk_text(f.read(), chunk_size, overlap)
+
+
+def _format_vectors(vectors: List[List[float]]) -> str:
+    """Format vectors one per line in the layout vectors.txt is read back with (runs in a worker process)"""
+    return "".join(str([float(x) for x in vector]) + "\n" for vector in vectors)
+
+
+def find_source_files(paths: List[str]) -> List[str]:
+    """Expand files and directories into a sorted list of source documents"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, name) for name in names if name.endswith(SOURCE_EXTENSIONS)
+                )
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"Warning: source not found: {path}")
+    return sorted(files)
+
+
+class MockEmbedder:
+    """Deterministic offline embedder for tests and dry runs; no network calls"""
+
+    def __init__(self, dimension: int = 768):
+        self.dimension = dimension
+        self.model_name = f"mock-hash-{dimension}"
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+            rng = random.Random(seed)
+            vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimension)]
+            norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+            vectors.append([x / norm for x in vector])
+        return vectors
+
+
+class CorpusBuilder:
+    """
+    Offline pipeline producing chunks.txt, vectors.txt and manifest.json.
+
+    Chunking and vector formatting run in a process pool; embedding batches
+    are sent concurrently from a thread pool and written in order, so an
+    interrupted run can resume from the number of vectors already on disk.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], List[List[float]]],
+        model_name: str,
+        output_dir: str,
+        chunk_size: int = 200,
+        overlap: int = 40,
+        batch_size: int = 32,
+        concurrency: int = 4,
+        processes: Optional[int] = None,
+        max_retries: int = 3,
+    ):
+        if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+            raise ValueError("chunk_size must be positive and overlap must be in [0, chunk_size)")
+        self.embed = embed
+        self.model_name = model_name
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.processes = processes
+        self.max_retries = max_retries
+
+    @property
+    def chunks_path(self) -> str:
+        return os.path.join(self.output_dir, CHUNKS_FILE)
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.output_dir, VECTORS_FILE)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.output_dir, MANIFEST_FILE)
+
+    def chunk_sources(self, sources: List[str]) -> List[str]:
+        """Chunk all source documents in parallel, keeping document order"""
+        args = [(path, self.chunk_size, self.overlap) for path in sources]
+        chunks = []
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            for path, doc_chunks in zip(sources, pool.map(_chunk_file, args)):
+                print(f"Chunked {path}: {len(doc_chunks)} chunks")
+                chunks.extend(doc_chunks)
+        return chunks
+
+    def build(self, sources: List[str], resume: bool = False) -> Dict:
+        """Run the full pipeline and return the written manifest"""
+        files = find_source_files(sources)
+        if not files:
+            raise ValueError("No source documents found")
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        chunks = self.chunk_sources(files)
+        print(f"Produced {len(chunks)} chunks from {len(files)} documents")
+
+        manifest = {
+            "status": "in_progress",
+            "embedding_model": self.model_name,
+            "dimension": None,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.overlap,
+            "chunk_count": len(chunks),
+            "sources": files,
+            "created_at": datetime.now().isoformat(),
+        }
+
+        done = 0
+        if resume:
+            done = self._check_resume(manifest)
+            manifest["dimension"] = self._read_manifest().get("dimension")
+            print(f"Resuming: {done} of {len(chunks)} chunks already embedded")
+        else:
+            with open(self.chunks_path, "w", encoding="utf-8") as f:
+                f.writelines(chunk + "\n" for chunk in chunks)
+            open(self.vectors_path, "w").close()
+        self._write_manifest(manifest)
+
+        self._embed_chunks(chunks, done, manifest)
+
+        manifest["status"] = "complete"
+        manifest["completed_at"] = datetime.now().isoformat()
+        self._write_manifest(manifest)
+        print(f"Wrote {self.chunks_path}, {self.vectors_path} and {self.manifest_path}")
+        return manifest
+
+    def _embed_chunks(self, chunks: List[str], done: int, manifest: Dict):
+        batches = [
+            chunks[start:start + self.batch_size]
+            for start in range(done, len(chunks), self.batch_size)
+        ]
+        window = max(1, self.concurrency)
+
+        with ThreadPoolExecutor(max_workers=window) as threads, \
+                ProcessPoolExecutor(max_workers=self.processes) as processes, \
+                open(self.vectors_path, "a") as vectors_file:
+            for start in range(0, len(batches), window):
+                # Embed a window of batches concurrently, then append them in order
+                futures = [threads.submit(self._embed_with_retry, batch) for batch in batches[start:start + window]]
+                results = [future.result() for future in futures]
+
+                if manifest["dimension"] is None:
+                    manifest["dimension"] = len(results[0][0])
+                    self._write_manifest(manifest)
+                for vectors in results:
+                    if any(len(vector) != manifest["dimension"] for vector in vectors):
+                        raise ValueError("Embedding dimension changed mid-build")
+
+                for text in processes.map(_format_vectors, results):
+                    vectors_file.write(text)
+                vectors_file.flush()
+
+                done += sum(len(vectors) for vectors in results)
+                print(f"Embedded {done}/{len(chunks)} chunks")
+
+    def _embed_with_retry(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embed(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"Embedding failed after {attempt + 1} attempts, rerun with --resume: {e}")
+                delay = 2 ** attempt
+                print(f"Embedding batch failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+    def _check_resume(self, manifest: Dict) -> int:
+        """Validate a previous run against this one and return how many vectors it completed"""
+        previous = self._read_manifest()
+        for key in ("embedding_model", "chunk_size", "chunk_overlap", "chunk_count", "sources"):
+            if previous.get(key) != manifest[key]:
+                raise ValueError(f"Cannot resume: {key} differs from the previous run")
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "w").close()
+            return 0
+
+        # Drop a trailing partial line left by an interrupted write
+        with open(self.vectors_path, "r+") as f:
+            content = f.read()
+            complete = content[:content.rfind("\n") + 1]
+            if len(complete) != len(content):
+                f.seek(0)
+                f.truncate()
+                f.write(complete)
+        return complete.count("\n")
+
+    def _read_manifest(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            raise ValueError(f"Cannot resume: no manifest at {self.manifest_path}")
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: Dict):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
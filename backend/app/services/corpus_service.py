@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional
+from app.core.config import settings
+from .ai_service import SYSTEM_PROMPT
+
+
+class Corpus:
+    """One knowledge base: its data files, Weaviate collection and persona prompt"""
+
+    def __init__(self, name: str, chunks_file: str, vectors_file: str, collection_name: str = None, system_prompt: str = None):
+        self.name = name
+        self.chunks_file = chunks_file
+        self.vectors_file = vectors_file
+        self.collection_name = collection_name or name
+        self.system_prompt = system_prompt or SYSTEM_PROMPT
+        self.weaviate_service = None
+        self.ready = False
+        self.last_attempt = 0.0
+        self.lock = asyncio.Lock()
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "collection_name": self.collection_name,
+            "ready": self.ready,
+            # Set when the collection no longer matches the data files and could not be rebuilt
+            "stale": self.weaviate_service.stale_reason if self.weaviate_service else None,
+        }
+
+
+class CorpusRegistry:
+    """
+    Named corpora served by one process. Each corpus gets its own
+    WeaviateService (collection or local index), created and loaded the
+    first time a request selects it.
+    """
+
+    retry_interval = 60.0
+
+    def __init__(self, corpora: List[Corpus], default_name: str):
+        self.corpora: Dict[str, Corpus] = {corpus.name: corpus for corpus in corpora}
+        if default_name not in self.corpora:
+            raise ValueError(f"Default corpus '{default_name}' is not configured")
+        self.default_name = default_name
+
+    @classmethod
+    def from_config(cls, config_path: str = None) -> "CorpusRegistry":
+        """
+        Load corpora from a JSON file of the form
+        {"default": "name", "corpora": [{"name", "chunks_file", "vectors_file", "collection_name", "system_prompt"}]}.
+        Without a config file, serve the single bundled "swamiji" corpus.
+        """
+        if config_path and os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            corpora = [Corpus(**entry) for entry in config["corpora"]]
+            return cls(corpora, config.get("default", corpora[0].name))
+
+        default = Corpus(
+            name="swamiji",
+            chunks_file=os.path.join("app", "static", "chunks.txt"),
+            vectors_file=os.path.join("app", "static", "vectors.txt"),
+        )
+        return cls([default], default.name)
+
+    def get(self, name: Optional[str] = None) -> Optional[Corpus]:
+        return self.corpora.get(name or self.default_name)
+
+    def resolve_name(self, name: Optional[str]) -> str:
+        return name or self.default_name
+
+    async def ensure_ready(self, name: Optional[str] = None):
+        """Return the corpus's search service, loading the corpus on first use"""
+        corpus = self.get(name)
+        if corpus is None:
+            raise KeyError(f"Unknown corpus: {name}")
+        if corpus.ready:
+            return corpus.weaviate_service
+
+        async with corpus.lock:
+            # Don't reload a failing corpus on every request
+            if not corpus.ready and time.monotonic() - corpus.last_attempt >= self.retry_interval:
+                corpus.last_attempt = time.monotonic()
+                corpus.ready = await asyncio.to_thread(self._load, corpus)
+        return corpus.weaviate_service if corpus.ready else None
+
+    def _load(self, corpus: Corpus) -> bool:
+        from .weaviate_service import WeaviateService
+
+        if corpus.weaviate_service is None:
+            corpus.weaviate_service = WeaviateService(collection_name=corpus.collection_name)
+        service = corpus.weaviate_service
+
+        if settings.RETRIEVAL_BACKEND == "local":
+            if not os.path.exists(corpus.chunks_file) or not os.path.exists(corpus.vectors_file):
+                print(f"Warning: Data files for corpus '{corpus.name}' not found at {corpus.chunks_file} or {corpus.vectors_file}")
+                return False
+            success = service.load_local_index(corpus.chunks_file, corpus.vectors_file)
+        else:
+            # Reuse a populated collection; ingest only when it is missing or empty
+            success = service.open_collection(corpus.chunks_file, corpus.vectors_file)
+        print(f"Corpus '{corpus.name}' {'ready' if success else 'failed to load'}")
+        return success
+
+    def close(self):
+        for corpus in self.corpora.values():
+            if corpus.weaviate_service:
+                corpus.weaviate_service.close()
+
+    def describe(self) -> List[Dict]:
+        return [corpus.describe() for corpus in self.corpora.values()]
+
+
+# Create a global instance
+corpus_registry = CorpusRegistry.from_config(settings.CORPORA_CONFIG)
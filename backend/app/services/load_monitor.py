@@ -0,0 +1,99 @@
+import time
+from typing import Any, Dict
+from app.core.config import settings
+
+# Service tiers, best first
+FULL = "full"
+REDUCED = "reduced"
+RETRIEVAL_ONLY = "retrieval_only"
+SHED = "shed"
+
+
+class ServiceUnavailableError(Exception):
+    """A chat turn could not be answered; the client should retry after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LoadMonitor:
+    """
+    Picks the service tier for each chat turn from measured load:
+
+    - full: normal RAG answer
+    - reduced: RAG answer with a smaller max_tokens budget, when LLM latency
+      or the number of turns in flight is elevated
+    - retrieval_only: answer with excerpts of the top chunks and skip the
+      LLM, while it is failing or critically slow (for a cooldown period)
+    - shed: reject immediately with 503 when too many turns are in flight
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.inflight = 0
+        self.latency_ewma_ms = 0.0
+        self.consecutive_failures = 0
+        self.llm_paused_until = 0.0
+        self.tier_counts: Dict[str, int] = {}
+        self.alpha = 0.3
+
+    def current_tier(self) -> str:
+        if not self.enabled:
+            return FULL
+        if self.inflight >= settings.DEGRADE_SHED_INFLIGHT:
+            return SHED
+        if time.monotonic() < self.llm_paused_until:
+            return RETRIEVAL_ONLY
+        if (self.inflight >= settings.DEGRADE_REDUCED_INFLIGHT
+                or self.latency_ewma_ms >= settings.DEGRADE_REDUCED_LATENCY_MS):
+            return REDUCED
+        return FULL
+
+    def admit(self) -> str:
+        """Pick the tier for a new turn and count it as in flight unless it is shed"""
+        tier = self.current_tier()
+        self.tier_counts[tier] = self.tier_counts.get(tier, 0) + 1
+        if tier != SHED:
+            self.inflight += 1
+        return tier
+
+    def release(self):
+        self.inflight -= 1
+
+    def retry_after(self) -> float:
+        return max(1.0, self.llm_paused_until - time.monotonic())
+
+    def record_llm_success(self, latency_ms: float):
+        self.consecutive_failures = 0
+        if self.latency_ewma_ms == 0.0:
+            self.latency_ewma_ms = latency_ms
+        else:
+            self.latency_ewma_ms += self.alpha * (latency_ms - self.latency_ewma_ms)
+        if self.latency_ewma_ms >= settings.DEGRADE_CRITICAL_LATENCY_MS:
+            self._pause_llm(f"latency {self.latency_ewma_ms:.0f}ms")
+
+    def record_llm_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.DEGRADE_FAILURE_THRESHOLD:
+            self._pause_llm(f"{self.consecutive_failures} consecutive failures")
+
+    def _pause_llm(self, reason: str):
+        print(f"LoadMonitor: pausing LLM calls for {settings.DEGRADE_COOLDOWN_SECONDS:.0f}s ({reason})")
+        self.llm_paused_until = time.monotonic() + settings.DEGRADE_COOLDOWN_SECONDS
+        self.consecutive_failures = 0
+        # Resume in the reduced tier; the next calls re-measure latency
+        self.latency_ewma_ms = min(self.latency_ewma_ms, settings.DEGRADE_REDUCED_LATENCY_MS)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "tier": self.current_tier(),
+            "inflight": self.inflight,
+            "llm_latency_ewma_ms": round(self.latency_ewma_ms, 1),
+            "llm_paused_for_s": round(max(0.0, self.llm_paused_until - time.monotonic()), 1),
+            "tier_counts": dict(self.tier_counts),
+        }
+
+
+# Create a global instance
+load_monitor = LoadMonitor(enabled=settings.DEGRADATION_ENABLED)
@@ -0,0 +1,197 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+
+class RequestProfile:
+    """Stage timings and an optional cProfile report for one request"""
+
+    def __init__(self, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.started_at = time.time()
+        self.total_ms: Optional[float] = None
+        self.stages: List[Dict] = []
+        self.report: Optional[str] = None
+
+    def add_stage(self, name: str, duration_ms: float):
+        self.stages.append({"stage": name, "ms": round(duration_ms, 2)})
+
+    def server_timing(self) -> str:
+        """Stage timings in Server-Timing header syntax"""
+        entries = [f"{s['stage']};dur={s['ms']}" for s in self.stages]
+        if self.total_ms is not None:
+            entries.append(f"total;dur={self.total_ms:.2f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "path": self.path,
+            "started_at": self.started_at,
+            "total_ms": self.total_ms,
+            "stages": self.stages,
+            "profile": self.report,
+        }
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage into the current request's profile; a no-op when not profiling"""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, (time.perf_counter() - start) * 1000)
+
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiling. Stage timings are always captured for a
+    profiled request; a cProfile report is added when no other profiled
+    request holds the profiler. cProfile sees the event-loop thread, so a
+    busy server's report includes other requests interleaved with this one.
+    """
+
+    def __init__(self, max_profiles: int = 100, report_lines: int = 40):
+        self.profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self.max_profiles = max_profiles
+        self.report_lines = report_lines
+        self.cprofile_lock = threading.Lock()
+
+    def start(self, path: str):
+        profile = RequestProfile(path)
+        token = current_profile.set(profile)
+        profiler = None
+        if self.cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiling tool (e.g. a debugger) is active
+                self.cprofile_lock.release()
+                profiler = None
+        return profile, token, profiler, time.perf_counter()
+
+    def finish(self, profile: RequestProfile, token, profiler, started: float):
+        profile.total_ms = round((time.perf_counter() - started) * 1000, 2)
+        current_profile.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            self.cprofile_lock.release()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.report_lines)
+            profile.report = out.getvalue()
+
+        self.profiles[profile.id] = profile
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return self.profiles.get(profile_id)
+
+    def summaries(self) -> List[Dict]:
+        return [
+            {"id": p.id, "path": p.path, "started_at": p.started_at, "total_ms": p.total_ms, "stages": p.stages}
+            for p in reversed(self.profiles.values())
+        ]
+
+
+class StackSampler:
+    """
+    Low-overhead sampling profiler that can be started and stopped at runtime.
+    A daemon thread snapshots every other thread's stack at a fixed interval
+    and counts collapsed stacks (flame graph input format).
+    """
+
+    def __init__(self, max_depth: int = 40):
+        self.max_depth = max_depth
+        self.interval = 0.01
+        self.counts: Counter = Counter()
+        # Guards counts, which the sampler thread writes while requests read it
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval: float = 0.01, reset: bool = True) -> bool:
+        if self.running:
+            return False
+        if reset:
+            with self.lock:
+                self.counts = Counter()
+                self.samples = 0
+        self.interval = interval
+        self.stop_event.clear()
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(stack)))
+            with self.lock:
+                self.counts.update(stacks)
+                self.samples += 1
+
+    def _snapshot(self) -> Counter:
+        with self.lock:
+            return self.counts.copy()
+
+    def top(self, limit: int = 25) -> List[Dict]:
+        return [{"stack": stack, "count": count} for stack, count in self._snapshot().most_common(limit)]
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self._snapshot().most_common())
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "started_at": self.started_at,
+        }
+
+
+# Create global instances
+request_profiler = RequestProfiler()
+stack_sampler = StackSampler()
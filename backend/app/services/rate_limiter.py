@@ -0,0 +1,157 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+
+class InMemoryRateLimitBackend:
+    """Token buckets in a dict; state is per process, so limits apply per worker"""
+
+    def __init__(self, max_buckets: int = 100_000):
+        # key -> (tokens, last update, seconds until a drained bucket is full again)
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        self.max_buckets = max_buckets
+
+    async def consume(self, checks: List[Tuple[str, float, float, float]]) -> float:
+        """
+        Take each check's cost from its bucket, given as (key, capacity, refill per
+        second, cost), but only if every bucket can pay. Return 0 if allowed, else
+        seconds until all of them could; a rejection debits nothing.
+        """
+        now = time.monotonic()
+        refilled = []
+        retry_after = 0.0
+        for key, capacity, refill_per_second, cost in checks:
+            tokens, updated, _ = self.buckets.get(key, (capacity, now, 0.0))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            if tokens < cost:
+                retry_after = max(retry_after, (cost - tokens) / refill_per_second)
+            refilled.append((key, capacity, refill_per_second, cost, tokens))
+
+        for key, capacity, refill_per_second, cost, tokens in refilled:
+            if retry_after == 0.0:
+                tokens -= cost
+            self.buckets[key] = (tokens, now, capacity / refill_per_second)
+        if len(self.buckets) > self.max_buckets:
+            self._prune(now)
+        return retry_after
+
+    def _prune(self, now: float):
+        # A bucket that would have refilled completely carries no state worth keeping
+        self.buckets = {
+            key: value for key, value in self.buckets.items() if now - value[1] < value[2]
+        }
+
+
+class RedisRateLimitBackend:
+    """Token buckets in Redis so every worker shares the same limits (needs the redis package)"""
+
+    # KEYS: one bucket per check; ARGV: now, then capacity, rate, cost per key.
+    # Every bucket is checked before any is debited, all in one atomic call.
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local state = {}
+    local retry = 0
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 3 - 1])
+        local rate = tonumber(ARGV[i * 3])
+        local cost = tonumber(ARGV[i * 3 + 1])
+        local data = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(data[1]) or capacity
+        local ts = tonumber(data[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+        if tokens < cost then
+            retry = math.max(retry, (cost - tokens) / rate)
+        end
+        state[i] = {tokens, cost, math.ceil(capacity / rate) + 1}
+    end
+    for i, key in ipairs(KEYS) do
+        local tokens = state[i][1]
+        if retry == 0 then
+            tokens = tokens - state[i][2]
+        end
+        redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', key, state[i][3])
+    end
+    return tostring(retry)
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(self.SCRIPT)
+
+    async def consume(self, checks: List[Tuple[str, float, float, float]]) -> float:
+        args = [time.time()]
+        for _, capacity, refill_per_second, cost in checks:
+            args.extend([capacity, refill_per_second, cost])
+        retry_after = await self.script(keys=[self.prefix + key for key, *_ in checks], args=args)
+        return float(retry_after)
+
+
+class RateLimiter:
+    """
+    Per-IP and per-session request buckets plus a per-IP budget of estimated
+    LLM tokens (prompt estimate + max_tokens reserved for the answer).
+    """
+
+    def __init__(self, backend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+        self.rejected = 0
+
+    @staticmethod
+    def estimate_tokens(message: str, max_tokens: int) -> int:
+        # Roughly four characters per token for English text
+        return len(message) // 4 + max_tokens
+
+    async def check(self, session_id: str, client_ip: Optional[str], message: str, max_tokens: int) -> float:
+        """Return 0 if the request may proceed, else the Retry-After delay in seconds"""
+        if not self.enabled:
+            return 0.0
+
+        client_ip = client_ip or "unknown"
+        token_cost = min(self.estimate_tokens(message, max_tokens), settings.RATE_LIMIT_TOKENS_PER_MINUTE)
+        checks = [
+            (f"ip:{client_ip}", settings.RATE_LIMIT_IP_BURST, settings.RATE_LIMIT_IP_PER_MINUTE, 1),
+            (f"session:{session_id}", settings.RATE_LIMIT_SESSION_BURST, settings.RATE_LIMIT_SESSION_PER_MINUTE, 1),
+            (f"tokens:{client_ip}", settings.RATE_LIMIT_TOKENS_PER_MINUTE, settings.RATE_LIMIT_TOKENS_PER_MINUTE, token_cost),
+        ]
+        # All buckets are checked together so a rejected request costs nothing
+        retry_after = await self.backend.consume([
+            (key, capacity, per_minute / 60.0, cost) for key, capacity, per_minute, cost in checks
+        ])
+        if retry_after > 0:
+            self.rejected += 1
+        return retry_after
+
+
+def client_ip_from(connection) -> Optional[str]:
+    """Client address of a Request or WebSocket, honouring X-Forwarded-For behind a trusted proxy"""
+    if settings.TRUST_PROXY_HEADERS:
+        # Each proxy appends the address it received the request from, so only
+        # the entries added by our own proxies (the right-most
+        # TRUSTED_PROXY_HOPS) can be trusted; anything left of them was sent
+        # by the client and could be forged to dodge the per-IP limits.
+        forwarded = [
+            address.strip()
+            for header in connection.headers.getlist("x-forwarded-for")
+            for address in header.split(",")
+            if address.strip()
+        ]
+        if forwarded:
+            return forwarded[-min(max(1, settings.TRUSTED_PROXY_HOPS), len(forwarded))]
+    return connection.client.host if connection.client else None
+
+
+def _create_backend():
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimitBackend(settings.RATE_LIMIT_REDIS_URL)
+    return InMemoryRateLimitBackend()
+
+
+# Create a global instance
+rate_limiter = RateLimiter(_create_backend(), enabled=settings.RATE_LIMIT_ENABLED)
@@ -0,0 +1,49 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+def normalize_query(text: str) -> str:
+    """Normalise a query so trivially different spellings share a coalescing key"""
+    return " ".join(text.lower().split())
+
+
+class RequestCoalescer:
+    """
+    Single-flight deduplication for async work.
+
+    Concurrent callers asking for the same key await one shared future instead
+    of each starting their own call. The future is forgotten as soon as it
+    completes, so this only merges work that is in flight at the same time.
+    """
+
+    def __init__(self):
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    async def run(self, stage: str, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func() for (stage, key), or join the call already in flight"""
+        flight_key = (stage, key)
+        stage_stats = self.stats.setdefault(stage, {"started": 0, "coalesced": 0})
+
+        future = self.inflight.get(flight_key)
+        if future is None:
+            stage_stats["started"] += 1
+            future = asyncio.ensure_future(func())
+            self.inflight[flight_key] = future
+            future.add_done_callback(lambda f: self._forget(flight_key, f))
+        else:
+            stage_stats["coalesced"] += 1
+
+        # Shield so one waiter being cancelled does not cancel the shared call
+        return await asyncio.shield(future)
+
+    def _forget(self, flight_key: Hashable, future: asyncio.Future):
+        if self.inflight.get(flight_key) is future:
+            del self.inflight[flight_key]
+        # Mark the exception as retrieved if every waiter went away
+        if not future.cancelled():
+            future.exception()
+
+
+# Create a global instance
+request_coalescer = RequestCoalescer()
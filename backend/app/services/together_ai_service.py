@@ -1,6 +1,7 @@
 import os
-from typing import List, Dict, Union
+from typing import Any, List, Dict, Union
 from together import Together
+from app.core.config import settings
 
 
 class TogetherAIService:
@@ -9,6 +10,7 @@ class TogetherAIService:
         self.client = None
         self.llm_model = "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"
         self.embedding_model = "togethercomputer/m2-bert-80M-32k-retrieval"
+        self.usage_totals = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
         
         if not self.api_key:
             print("Warning: TOGETHER_API_KEY environment variable is not set. TogetherAI features will be disabled.")
@@ -19,49 +21,109 @@ class TogetherAIService:
             os.environ['TOGETHER_API_KEY'] = self.api_key
             
             # Initialize the client
-            self.client = Together(api_key=self.api_key)
+            self.client = Together(
+                api_key=self.api_key,
+                timeout=settings.LLM_TIMEOUT,
+                max_retries=settings.LLM_MAX_RETRIES
+            )
             print("TogetherAI client initialized successfully")
         except Exception as e:
             print(f"Failed to initialize TogetherAI client: {e}")
             self.client = None
     
-    def call_llm(self, prompt: str, system_prompt: str = None) -> str:
+    def chat_completion(self, messages: List[Dict[str, str]], max_tokens: int = 512) -> Dict[str, Any]:
         """
-        Call the TogetherAI LLM with the given prompt and optional system prompt.
+        Call the TogetherAI chat-completions endpoint with a list of role messages.
+        
+        Messages should be ordered from the most stable to the most volatile
+        (system prompt, then prior turns, then the current question) so the
+        provider can reuse the cached prompt prefix between turns.
         
         Args:
-            prompt (str): The user prompt
-            system_prompt (str, optional): The system prompt
+            messages (List[Dict[str, str]]): Chat messages with "role" and "content" keys
+            max_tokens (int): Maximum number of tokens to generate
             
         Returns:
-            str: The generated response
+            Dict[str, Any]: The generated "text" plus "prompt_tokens" and "completion_tokens"
+            
+        Raises:
+            RuntimeError: If the service is not configured or the call fails
         """
         if not self.client:
-            return "TogetherAI service is not available. Please set the TOGETHER_API_KEY environment variable."
+            raise RuntimeError("TogetherAI service is not available. Please set the TOGETHER_API_KEY environment variable.")
         
         try:
-            # Prepare the full prompt with system prompt if provided
-            if system_prompt:
-                full_prompt = f"<|system|>\n{system_prompt}\n<|user|>\n{prompt}\n<|assistant|>\n"
-            else:
-                full_prompt = f"<|user|>\n{prompt}\n<|assistant|>\n"
-            
-            # Use the modern API for Together AI v1.5.25
-            response = self.client.completions.create(
+            response = self.client.chat.completions.create(
                 model=self.llm_model,
-                prompt=full_prompt,
-                max_tokens=1024,
+                messages=messages,
+                max_tokens=max_tokens,
                 temperature=0.7,
                 top_p=0.7,
                 top_k=50,
                 repetition_penalty=1.1
             )
             
-            return response.choices[0].text
+            usage = getattr(response, "usage", None)
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            self.record_usage(prompt_tokens, completion_tokens)
+            print(f"TogetherAI usage: prompt_tokens={prompt_tokens}, completion_tokens={completion_tokens}, max_tokens={max_tokens}")
+            
+            return {
+                "text": response.choices[0].message.content,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+            }
             
         except Exception as e:
             print(f"Error calling TogetherAI LLM: {e}")
-            return f"Error generating response: {str(e)}"
+            raise RuntimeError(f"Error generating response: {e}") from e
+    
+    def call_llm(self, prompt: str, system_prompt: str = None, max_tokens: int = 512) -> str:
+        """
+        Call the TogetherAI LLM with the given prompt and optional system prompt.
+        
+        Args:
+            prompt (str): The user prompt
+            system_prompt (str, optional): The system prompt
+            max_tokens (int): Maximum number of tokens to generate
+            
+        Returns:
+            str: The generated response
+        """
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return self.chat_completion(messages, max_tokens=max_tokens)["text"]
+    
+    def record_usage(self, prompt_tokens: int, completion_tokens: int):
+        """Accumulate token usage across all LLM requests"""
+        self.usage_totals["requests"] += 1
+        self.usage_totals["prompt_tokens"] += prompt_tokens
+        self.usage_totals["completion_tokens"] += completion_tokens
+    
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts in one request, raising on failure.
+        
+        Args:
+            texts (List[str]): Texts to embed
+            
+        Returns:
+            List[List[float]]: One embedding per text, in input order
+        """
+        if not self.client:
+            raise RuntimeError("TogetherAI client not available")
+        
+        response = self.client.embeddings.create(
+            model=self.embedding_model,
+            input=texts
+        )
+        
+        # Results carry an index; don't rely on the response order
+        data = sorted(response.data, key=lambda item: getattr(item, "index", 0) or 0)
+        return [item.embedding for item in data]
     
     def generate_embeddings(self, input_text: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
         """
@@ -82,28 +144,10 @@ class TogetherAIService:
                 return [[0.0] * 768 for _ in input_text]
         
         try:
-            # Ensure input is a list
             if isinstance(input_text, str):
-                input_list = [input_text]
-                single_input = True
-            else:
-                input_list = input_text
-                single_input = False
+                return self.embed_batch([input_text])[0]
+            return self.embed_batch(input_text)
             
-            # Use the modern API for embeddings
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=input_list
-            )
-            
-            embeddings = response.data[0].embedding
-            
-            # Return single embedding if single input was provided
-            if single_input:
-                return embeddings
-            else:
-                return [embeddings] if isinstance(embeddings, list) else [embeddings]
-                
         except Exception as e:
             print(f"Error generating embeddings: {e}")
             # Return empty embedding of appropriate size for the model
@@ -0,0 +1,142 @@
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+QUANTIZATIONS = ("none", "int8")
+
+
+def read_vectors_file(vectors_file_path: str) -> np.ndarray:
+    """Read vectors.txt (one "[x, y, ...]" list per line) into a float32 matrix"""
+    rows = []
+    with open(vectors_file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rows.append([float(x) for x in line.strip("[]").split(",")])
+    return np.asarray(rows, dtype=np.float32)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class LocalVectorIndex:
+    """
+    Brute-force cosine index held in process, optionally int8 scalar-quantised.
+
+    With int8 quantisation only the 1-byte codes and a per-dimension scale stay
+    in memory. Candidates are ranked on the codes, then the top
+    limit * rescore_factor are rescored against full-precision vectors kept in
+    a memory-mapped .npy file, so only those rows are read from disk.
+    """
+
+    def __init__(self, quantization: str = "int8", rescore_factor: int = 4, block_size: int = 4096):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+        self.vectors: Optional[np.ndarray] = None
+        self.codes: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+        self.full_precision: Optional[np.ndarray] = None
+
+    def build(self, vectors: np.ndarray, full_precision_path: str = None):
+        """
+        Index the given vectors. For int8, full-precision rows are written to
+        full_precision_path and memory-mapped; without a path they stay in memory.
+        """
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+        if self.quantization == "none":
+            self.vectors = vectors
+            return self
+
+        max_abs = np.abs(vectors).max(axis=0)
+        max_abs[max_abs == 0] = 1.0
+        self.scale = (max_abs / 127.0).astype(np.float32)
+        self.codes = np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+        if full_precision_path:
+            self.full_precision = self._map_full_precision(vectors, full_precision_path)
+        else:
+            self.full_precision = vectors
+        return self
+
+    @staticmethod
+    def _map_full_precision(vectors: np.ndarray, path: str) -> np.ndarray:
+        """
+        Memory-map `vectors` from `path`, reusing the file if it already holds
+        them. Otherwise a new file is written beside it and renamed into place,
+        so other workers mapping the old file never see it truncated.
+        """
+        if os.path.exists(path):
+            try:
+                existing = np.load(path, mmap_mode="r")
+                if existing.shape == vectors.shape and existing.dtype == vectors.dtype and np.array_equal(existing, vectors):
+                    return existing
+            except (OSError, ValueError) as e:
+                print(f"Rewriting unreadable vector file {path}: {e}")
+
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".npy.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, vectors)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return np.load(path, mmap_mode="r")
+
+    def __len__(self) -> int:
+        if self.vectors is not None:
+            return len(self.vectors)
+        return 0 if self.codes is None else len(self.codes)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Bytes of index data resident in memory (excluding memory-mapped rows)"""
+        if self.vectors is not None:
+            return self.vectors.nbytes
+        total = self.codes.nbytes + self.scale.nbytes
+        if not isinstance(self.full_precision, np.memmap):
+            total += self.full_precision.nbytes
+        return total
+
+    def search(self, query_vector: List[float], limit: int = 5, rescore: bool = True) -> List[Tuple[int, float]]:
+        """Return (row index, cosine similarity) pairs for the best matches"""
+        if len(self) == 0:
+            return []
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32))
+
+        if self.vectors is not None:
+            return self._top_k(self.vectors @ query, limit)
+
+        # Scoring against codes: q . (codes * scale) == (q * scale) . codes
+        scaled_query = query * self.scale
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_size):
+            block = self.codes[start:start + self.block_size]
+            scores[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+
+        if not rescore:
+            return self._top_k(scores, limit)
+
+        candidates = [index for index, _ in self._top_k(scores, limit * self.rescore_factor)]
+        candidates.sort()  # sequential reads from the memory map
+        exact = np.asarray(self.full_precision[candidates]) @ query
+        ranked = sorted(zip(candidates, exact.tolist()), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
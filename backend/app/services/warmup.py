@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from .request_coalescer import normalize_query
+
+
+def load_warmup_queries(path: str) -> List[str]:
+    """Read one query per line, skipping blank lines and "#" comments"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+class WarmupRunner:
+    """
+    Replays frequent queries through the chat engine at startup so the first
+    real requests hit warm embedding, retrieval and (optionally) answer caches.
+    Runs as a background task; requests are served while it works.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.state = "idle"
+        self.total = 0
+        self.warmed = 0
+        self.failed = 0
+        self.duration_s: Optional[float] = None
+
+    def start(self, engine, store=None):
+        if not settings.WARMUP_ENABLED or self.task is not None:
+            return
+        self.task = asyncio.create_task(self.run(engine, store))
+
+    async def collect_queries(self, store=None) -> List[str]:
+        """Configured queries first, then the previous run's most asked questions, deduplicated"""
+        queries = load_warmup_queries(settings.WARMUP_QUERIES_FILE)
+        if store and settings.WARMUP_TOP_QUERIES > 0:
+            try:
+                top = await asyncio.to_thread(store.top_user_queries, settings.WARMUP_TOP_QUERIES)
+                queries.extend(query for query, _ in top)
+            except Exception as e:
+                print(f"Warm-up: could not read previous queries: {e}")
+
+        seen = set()
+        unique = []
+        for query in queries:
+            key = normalize_query(query)
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(query)
+        return unique
+
+    async def run(self, engine, store=None):
+        start = time.perf_counter()
+        self.state = "running"
+        self.warmed = self.failed = 0
+        queries = await self.collect_queries(store)
+        self.total = len(queries)
+        semaphore = asyncio.Semaphore(settings.WARMUP_CONCURRENCY)
+        precompute = settings.WARMUP_PRECOMPUTE_ANSWERS
+
+        async def warm_one(query: str):
+            nonlocal precompute
+            async with semaphore:
+                try:
+                    if await engine.warm(query, precompute=precompute):
+                        self.warmed += 1
+                    else:
+                        self.failed += 1
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Warm-up failed for '{query[:50]}': {e}")
+                    if precompute:
+                        # Don't keep calling an LLM that is failing; caches still get warmed
+                        precompute = False
+                        print("Warm-up: stopped precomputing answers")
+
+        await asyncio.gather(*(warm_one(query) for query in queries))
+        self.duration_s = round(time.perf_counter() - start, 2)
+        self.state = "done"
+        print(f"Warm-up: {self.warmed}/{self.total} queries warmed in {self.duration_s}s")
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.state = "cancelled"
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "queries": self.total,
+            "warmed": self.warmed,
+            "failed": self.failed,
+            "duration_s": self.duration_s,
+        }
+
+
+# Create a global instance
+warmup_runner = WarmupRunner()
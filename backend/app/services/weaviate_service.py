@@ -2,15 +2,22 @@ import weaviate
 import ast
 import tqdm
 import os
+import json
 from typing import List, Dict, Any
+from app.core.config import settings
 from .together_ai_service import together_ai_service
 
 
 class WeaviateService:
-    def __init__(self):
+    def __init__(self, collection_name: str = "swamiji"):
         self.client = None
         self.collection = None
-        self.collection_name = "swamiji"
+        self.collection_name = collection_name
+        # Optional in-process index, used when RETRIEVAL_BACKEND is "local"
+        self.local_index = None
+        self.local_chunks: List[str] = []
+        # Why the collection was last found out of date with its data files, if it was
+        self.stale_reason = None
         
     def connect(self):
         """Connect to Weaviate instance"""
@@ -67,9 +74,10 @@ class WeaviateService:
                 properties=[
                     weaviate.classes.config.Property(name="chunk", data_type=weaviate.classes.config.DataType.TEXT),
                     weaviate.classes.config.Property(name="chunk_index", data_type=weaviate.classes.config.DataType.INT),
-                ]
+                ],
+                vector_index_config=self._vector_index_config()
             )
-            print(f"Created collection: {self.collection_name}")
+            print(f"Created collection: {self.collection_name} (quantization={settings.WEAVIATE_QUANTIZATION})")
             return True
             
         except Exception as e:
@@ -78,6 +86,26 @@ class WeaviateService:
     
 
     
+    def _vector_index_config(self):
+        """HNSW config with the quantizer selected by WEAVIATE_QUANTIZATION (none, pq, bq or sq)"""
+        Configure = weaviate.classes.config.Configure
+        quantization = settings.WEAVIATE_QUANTIZATION
+        if quantization == "pq":
+            # PQ rescoring against the stored vectors is done by Weaviate itself
+            quantizer = Configure.VectorIndex.Quantizer.pq(training_limit=settings.WEAVIATE_PQ_TRAINING_LIMIT)
+        elif quantization == "bq":
+            quantizer = Configure.VectorIndex.Quantizer.bq(rescore_limit=settings.VECTOR_RESCORE_LIMIT)
+        elif quantization == "sq":
+            quantizer = Configure.VectorIndex.Quantizer.sq(
+                rescore_limit=settings.VECTOR_RESCORE_LIMIT,
+                training_limit=settings.WEAVIATE_PQ_TRAINING_LIMIT
+            )
+        else:
+            if quantization != "none":
+                print(f"Unknown WEAVIATE_QUANTIZATION '{quantization}', using full precision")
+            quantizer = None
+        return Configure.VectorIndex.hnsw(quantizer=quantizer)
+    
     def read_two_files_line_by_line(self, file1_path: str, file2_path: str) -> List[Dict[str, Any]]:
         """Read chunks and vectors from two files and return structured data"""
         chunk_objs = []
@@ -106,7 +134,8 @@ class WeaviateService:
                             # Create chunk object
                             chunk_obj = {
                                 "chunk": chunk_text,
-                                "chunk_index": chunk_index
+                                "chunk_index": chunk_index,
+                                "vector": vector
                             }
                             
                             chunk_objs.append(chunk_obj)
@@ -155,14 +184,23 @@ class WeaviateService:
             
             print(f"Loading {len(chunk_objs)} chunks into collection...")
             
-            # Add objects to collection using modern API
+            # Add objects to collection in batches rather than one request per chunk
             collection = self.client.collections.get(self.collection_name)
-            for chunk_object in tqdm.tqdm(chunk_objs, desc="Loading chunks"):
-                try:
-                    collection.data.insert(chunk_object)
-                    print(f"Added chunk {chunk_object['chunk_index']}")
-                except Exception as e:
-                    print(f"Failed to add chunk {chunk_object['chunk_index']}: {e}")
+            batch_size = 500
+            for start in tqdm.tqdm(range(0, len(chunk_objs), batch_size), desc="Loading chunks"):
+                batch = chunk_objs[start:start + batch_size]
+                result = collection.data.insert_many([
+                    weaviate.classes.data.DataObject(
+                        properties={
+                            "chunk": chunk_object["chunk"],
+                            "chunk_index": chunk_object["chunk_index"]
+                        },
+                        vector=chunk_object["vector"]
+                    )
+                    for chunk_object in batch
+                ])
+                for index, error in result.errors.items():
+                    print(f"Failed to add chunk {batch[index]['chunk_index']}: {error.message}")
             
             print(f"Successfully loaded {len(chunk_objs)} chunks into collection")
             return True
@@ -210,9 +248,128 @@ class WeaviateService:
             print("Assuming collection is empty and loading data...")
             return self.load_data_to_collection(chunks_file_path, vectors_file_path, max_chunks)
     
-    def search_similar_chunks(self, query: str, limit: int = 5):
-        """Search for similar chunks using vector similarity"""
+    def open_collection(self, chunks_file_path: str, vectors_file_path: str) -> bool:
+        """
+        Connect to the collection, ingesting the data files only if the
+        collection is missing, empty or out of date. Unlike
+        initialize_collection, a populated collection that still matches the
+        data files (object count and WEAVIATE_QUANTIZATION) is used as is.
+        """
+        if not self.client and not self.connect():
+            print("Failed to connect to Weaviate")
+            return False
+        
+        files_present = os.path.exists(chunks_file_path) and os.path.exists(vectors_file_path)
+        try:
+            if self.client.collections.exists(self.collection_name):
+                collection = self.client.collections.get(self.collection_name)
+                total_count = len(collection)
+                if total_count > 0:
+                    self.stale_reason = self._stale_reason(collection, total_count, chunks_file_path, vectors_file_path) if files_present else None
+                    if not self.stale_reason:
+                        print(f"Collection {self.collection_name} already contains {total_count} objects")
+                        return True
+                    print(f"Collection {self.collection_name} is out of date ({self.stale_reason}), rebuilding...")
+                    if not self.create_collection():
+                        print("Failed to recreate collection")
+                        # Still serve the old collection if it was not deleted
+                        return self.client.collections.exists(self.collection_name)
+            elif not self.create_collection():
+                print("Failed to create collection")
+                return False
+        except Exception as e:
+            print(f"Error opening collection {self.collection_name}: {e}")
+            return False
+        
+        if not files_present:
+            print(f"Collection {self.collection_name} is empty and its data files are missing")
+            return False
+        print(f"Collection {self.collection_name} is empty, loading data...")
+        if not self.load_data_to_collection(chunks_file_path, vectors_file_path):
+            return False
+        self.stale_reason = None
+        return True
+    
+    def _stale_reason(self, collection, total_count: int, chunks_file_path: str, vectors_file_path: str):
+        """Describe how a populated collection differs from its data files, or None if it matches"""
+        expected = self._expected_chunk_count(chunks_file_path, vectors_file_path)
+        if total_count != expected:
+            return f"{total_count} objects, data files have {expected} chunks"
+        try:
+            quantizer = collection.config.get().vector_index_config.quantizer
+        except Exception as e:
+            print(f"Could not read the config of collection {self.collection_name}: {e}")
+            return None
+        # Quantizer configs are named _PQConfig, _BQConfig, _SQConfig, ...
+        quantization = type(quantizer).__name__.strip("_").replace("Config", "").lower() if quantizer else "none"
+        wanted = settings.WEAVIATE_QUANTIZATION if settings.WEAVIATE_QUANTIZATION in ("pq", "bq", "sq") else "none"
+        if quantization != wanted:
+            return f"quantization {quantization}, WEAVIATE_QUANTIZATION is {wanted}"
+        return None
+    
+    @staticmethod
+    def _expected_chunk_count(chunks_file_path: str, vectors_file_path: str) -> int:
+        """
+        Chunks an ingest of the data files would load: chunk_count from the
+        corpus builder's manifest.json when complete, else the paired lines.
+        """
+        manifest_path = os.path.join(os.path.dirname(chunks_file_path), "manifest.json")
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("status") == "complete" and isinstance(manifest.get("chunk_count"), int):
+                return manifest["chunk_count"]
+        except (OSError, ValueError):
+            pass
+        with open(chunks_file_path, "r", encoding="utf-8") as chunks, open(vectors_file_path, "r") as vectors:
+            return sum(1 for _ in zip(chunks, vectors))
+    
+    def load_local_index(self, chunks_file_path: str, vectors_file_path: str) -> bool:
+        """Build the in-process vector index from the chunk and vector files"""
+        try:
+            from .vector_index import LocalVectorIndex, read_vectors_file
+            
+            with open(chunks_file_path, 'r', encoding='utf-8') as f:
+                chunks = [line.strip() for line in f]
+            vectors = read_vectors_file(vectors_file_path)
+            if len(chunks) < len(vectors):
+                print(f"Warning: {len(vectors)} vectors but only {len(chunks)} chunks, truncating")
+                vectors = vectors[:len(chunks)]
+            
+            index = LocalVectorIndex(
+                quantization=settings.LOCAL_INDEX_QUANTIZATION,
+                rescore_factor=settings.LOCAL_INDEX_RESCORE_FACTOR
+            )
+            full_precision_path = os.path.join(settings.LOCAL_INDEX_CACHE_DIR, f"{self.collection_name}.npy")
+            index.build(vectors, full_precision_path=full_precision_path)
+            
+            self.local_chunks = chunks
+            self.local_index = index
+            print(f"Local index ready: {len(index)} vectors, {index.memory_bytes / 1024:.0f} KiB resident ({index.quantization})")
+            return True
+        except Exception as e:
+            print(f"Failed to build local index: {e}")
+            return False
+    
+    def search_local(self, query: str, limit: int = 5, query_embedding: List[float] = None):
+        """Search the in-process index; results match search_similar_chunks"""
+        if query_embedding is None:
+            query_embedding = together_ai_service.generate_embeddings(query)
+        if all(x == 0.0 for x in query_embedding):
+            print("Zero embedding detected, local search not possible")
+            return []
+        
+        return [
+            {"chunk": self.local_chunks[index], "chunk_index": index}
+            for index, _ in self.local_index.search(query_embedding, limit)
+        ]
+    
+    def search_similar_chunks(self, query: str, limit: int = 5, query_embedding: List[float] = None):
+        """Search for similar chunks using vector similarity, reusing query_embedding if given"""
         print(f"Searching for query: '{query}' with limit: {limit}")
+        if self.local_index is not None:
+            return self.search_local(query, limit, query_embedding)
+        
         if not self.client:
             print("Weaviate client not connected")
             return []
@@ -231,7 +388,8 @@ class WeaviateService:
             
         try:
             # Generate embedding for the query using TogetherAI
-            query_embedding = together_ai_service.generate_embeddings(query)
+            if query_embedding is None:
+                query_embedding = together_ai_service.generate_embeddings(query)
             print(f"Query embedding generated:{query_embedding[:5]}, {len(query_embedding)} dimensions")
             
             # Check if embedding is all zeros (TogetherAI not available)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Memory saved versus recall@k for the vector compression options.
+
+Queries are corpus vectors with Gaussian noise added (a stand-in for real
+query embeddings, which sit near but not on the passages they retrieve).
+Exact float32 search is the ground truth.
+
+    python bench_quantization.py --vectors app/static/vectors.txt --k 5
+    python bench_quantization.py --synthetic 20000 --dimension 768
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append('.')
+
+from app.services.vector_index import LocalVectorIndex, normalize_rows, read_vectors_file
+
+
+def recall_at_k(truth, results, k):
+    hits = sum(len(set(t[:k]) & set(r[:k])) for t, r in zip(truth, results))
+    return hits / (k * len(truth))
+
+
+def run_index(index, queries, k, **search_kwargs):
+    start = time.perf_counter()
+    results = [[i for i, _ in index.search(q, k, **search_kwargs)] for q in queries]
+    elapsed = (time.perf_counter() - start) / len(queries)
+    return results, elapsed
+
+
+def bq_results(vectors, queries, k, rescore_limit):
+    """Simulate Weaviate BQ: rank on sign bits, then rescore the top candidates exactly"""
+    signs = np.packbits(vectors > 0, axis=1)
+    dimension = vectors.shape[1]
+    results = []
+    for q in queries:
+        q_bits = np.packbits(q > 0)
+        hamming = np.unpackbits(signs ^ q_bits, axis=1).sum(axis=1)
+        candidates = np.argsort(hamming)[:max(k, rescore_limit)]
+        exact = vectors[candidates] @ q
+        results.append(candidates[np.argsort(-exact)][:k].tolist())
+    return results, dimension / 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector quantisation memory/recall benchmark")
+    parser.add_argument("--vectors", default=os.path.join("app", "static", "vectors.txt"))
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead of a file")
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="query noise relative to vector norm")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--bq-rescore-limit", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        vectors = rng.standard_normal((args.synthetic, args.dimension)).astype(np.float32)
+    else:
+        vectors = read_vectors_file(args.vectors)
+    vectors = normalize_rows(vectors)
+    count, dimension = vectors.shape
+    print(f"{count} vectors x {dimension} dimensions, {args.queries} queries, k={args.k}")
+
+    picks = rng.integers(0, count, size=args.queries)
+    noise = rng.standard_normal((args.queries, dimension)).astype(np.float32) * args.noise / np.sqrt(dimension)
+    queries = normalize_rows(vectors[picks] + noise)
+
+    exact = LocalVectorIndex("none").build(vectors)
+    truth, exact_time = run_index(exact, queries, args.k)
+    full_bytes = exact.memory_bytes
+
+    print(f"\n{'index':<32}{'resident':>12}{'saved':>8}{'recall@k':>10}{'ms/query':>10}")
+
+    def row(name, resident, recall, seconds=None):
+        saved = 1 - resident / full_bytes
+        timing = f"{seconds * 1000:10.2f}" if seconds is not None else f"{'-':>10}"
+        print(f"{name:<32}{resident / 1024 / 1024:10.2f}MB{saved:8.0%}{recall:10.3f}{timing}")
+
+    row("float32 (exact)", full_bytes, 1.0, exact_time)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        int8 = LocalVectorIndex("int8", rescore_factor=args.rescore_factor).build(
+            vectors, full_precision_path=os.path.join(tmp, "full.npy")
+        )
+        results, seconds = run_index(int8, queries, args.k, rescore=False)
+        row("int8, no rescoring", int8.memory_bytes, recall_at_k(truth, results, args.k), seconds)
+        results, seconds = run_index(int8, queries, args.k, rescore=True)
+        row(f"int8, rescore top {args.k * args.rescore_factor}", int8.memory_bytes, recall_at_k(truth, results, args.k), seconds)
+        del int8
+
+    results, bytes_per_vector = bq_results(vectors, queries, args.k, args.bq_rescore_limit)
+    row(f"bq (sim.), rescore top {args.bq_rescore_limit}", bytes_per_vector * count, recall_at_k(truth, results, args.k))
+
+    print("\nWeaviate per-vector index memory (before HNSW graph overhead):")
+    print(f"  none: {4 * dimension} B   sq: {dimension} B   bq: {dimension // 8} B   "
+          f"pq (1 byte/segment, {dimension // 4} segments): {dimension // 4} B")
+
+
+if __name__ == "__main__":
+    main()
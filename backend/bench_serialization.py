@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of per-message serialisation cost on the chat hot paths.
+
+Compares the previous json/model_dump path with the Pydantic JSON/orjson
+path now used by the WebSocket loop and the history endpoint.
+
+    python bench_serialization.py --iterations 20000 --history 100
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime
+
+import orjson
+
+sys.path.append('.')
+
+from app.models.chat import ChatRequest, ChatResponse, ChatMessage, ChatSession
+
+
+def build_session(size: int) -> ChatSession:
+    session = ChatSession(session_id="bench", messages=[])
+    for i in range(size):
+        if i % 2 == 0:
+            session.messages.append(ChatMessage(
+                id=f"user_{i:08x}", message="What is the nature of the self? " * 4,
+                timestamp=datetime.now().isoformat(), is_user=True
+            ))
+        else:
+            session.messages.append(ChatResponse(
+                id=f"ai_{i:08x}", message="The self is that which observes the observer. " * 30,
+                timestamp=datetime.now().isoformat(), is_user=False,
+                usage={"prompt_tokens": 900, "completion_tokens": 350}
+            ))
+    return session
+
+
+def report(name: str, seconds: float, iterations: int):
+    print(f"{name:<48} {seconds / iterations * 1e6:10.2f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat serialisation microbenchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--history", type=int, default=100, help="messages in the history session")
+    args = parser.parse_args()
+
+    frame = json.dumps({"message": "What is the nature of the self and how do I find it?"})
+    response = build_session(2).messages[1]
+    session = build_session(args.history)
+    n = args.iterations
+    history_n = max(1, n // 100)
+
+    print("WebSocket receive")
+    report("json.loads + ChatRequest(**data)", timeit.timeit(lambda: ChatRequest(**json.loads(frame)), number=n), n)
+    report("ChatRequest.model_validate_json", timeit.timeit(lambda: ChatRequest.model_validate_json(frame), number=n), n)
+
+    print("WebSocket send")
+    report("json.dumps(model_dump())", timeit.timeit(lambda: json.dumps(response.model_dump()), number=n), n)
+    report("model_dump_json()", timeit.timeit(lambda: response.model_dump_json(), number=n), n)
+    report("orjson.dumps(model_dump())", timeit.timeit(lambda: orjson.dumps(response.model_dump()), number=n), n)
+
+    print(f"History ({args.history} messages)")
+    report(
+        "re-validate + json.dumps (previous endpoint)",
+        timeit.timeit(lambda: json.dumps(ChatSession.model_validate(session.model_dump()).model_dump()), number=history_n),
+        history_n,
+    )
+    report("model_dump_json()", timeit.timeit(lambda: session.model_dump_json(), number=history_n), history_n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Build the retrieval corpus (chunks.txt, vectors.txt, manifest.json) from source documents.
+
+    python build_corpus.py docs/ --output-dir app/static
+    python build_corpus.py docs/ --output-dir app/static --resume
+    python build_corpus.py docs/ --output-dir /tmp/corpus --mock-embeddings
+"""
+
+import argparse
+import sys
+sys.path.append('.')
+
+from app.services.corpus_builder import CorpusBuilder, MockEmbedder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk and embed source documents for retrieval")
+    parser.add_argument("sources", nargs="+", help="source files or directories (.txt, .md)")
+    parser.add_argument("--output-dir", default="app/static")
+    parser.add_argument("--chunk-size", type=int, default=200, help="words per chunk")
+    parser.add_argument("--overlap", type=int, default=40, help="words shared by consecutive chunks")
+    parser.add_argument("--batch-size", type=int, default=32, help="texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes for chunking/formatting")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted build in output-dir")
+    parser.add_argument("--mock-embeddings", action="store_true", help="use deterministic local embeddings")
+    parser.add_argument("--mock-dimension", type=int, default=768)
+    args = parser.parse_args()
+
+    if args.mock_embeddings:
+        embedder = MockEmbedder(args.mock_dimension)
+        embed, model_name = embedder, embedder.model_name
+    else:
+        from app.services.together_ai_service import together_ai_service
+        if not together_ai_service.client:
+            print("TogetherAI client not available; set TOGETHER_API_KEY or use --mock-embeddings")
+            sys.exit(1)
+        embed, model_name = together_ai_service.embed_batch, together_ai_service.embedding_model
+
+    builder = CorpusBuilder(
+        embed=embed,
+        model_name=model_name,
+        output_dir=args.output_dir,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        processes=args.processes,
+        max_retries=args.max_retries,
+    )
+    try:
+        manifest = builder.build(args.sources, resume=args.resume)
+    except (ValueError, RuntimeError) as e:
+        print(f"Corpus build failed: {e}")
+        sys.exit(1)
+    print(f"Built {manifest['chunk_count']} chunks with {manifest['embedding_model']} ({manifest['dimension']} dimensions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Soak test for the chat WebSocket endpoint.
+
+Opens many concurrent sockets against one running worker, keeps them alive
+with application-level pings for a while and reports how many stayed
+connected and the ping round-trip latency. Pings are answered by the
+connection manager without touching the LLM, so this measures connection
+handling only. Raise the open-file limit (ulimit -n) for both processes
+before going past a thousand sockets.
+
+    uvicorn app.main:app --port 8000 &
+    python soak_websockets.py --connections 5000 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import websockets
+
+
+async def hold_connection(url: str, duration: float, interval: float, latencies: list, stats: dict):
+    try:
+        async with websockets.connect(url, open_timeout=30, ping_interval=None) as ws:
+            stats["connected"] += 1
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                await ws.send(json.dumps({"type": "ping"}))
+                reply = json.loads(await ws.recv())
+                if reply.get("type") == "pong":
+                    latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(interval)
+            stats["completed"] += 1
+    except Exception as e:
+        stats["failed"] += 1
+        stats["last_error"] = repr(e)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Hold many chat WebSockets open against one worker")
+    parser.add_argument("--url", default="ws://localhost:8000/api/v1/chat/ws")
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to hold each socket")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between pings")
+    parser.add_argument("--ramp", type=float, default=500.0, help="new connections per second")
+    args = parser.parse_args()
+
+    latencies = []
+    stats = {"connected": 0, "completed": 0, "failed": 0, "last_error": None}
+    tasks = []
+    started = time.monotonic()
+    for i in range(args.connections):
+        url = f"{args.url}/soak_{i}"
+        tasks.append(asyncio.create_task(hold_connection(url, args.duration, args.interval, latencies, stats)))
+        await asyncio.sleep(1.0 / args.ramp)
+    print(f"Opened {args.connections} connection attempts in {time.monotonic() - started:.1f}s")
+
+    await asyncio.gather(*tasks)
+
+    print(f"Connected: {stats['connected']}, held to completion: {stats['completed']}, failed: {stats['failed']}")
+    if stats["last_error"]:
+        print(f"Last error: {stats['last_error']}")
+    if latencies:
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if len(latencies) >= 100 else latencies[-1]
+        print(
+            f"Ping round trips: {len(latencies)}, "
+            f"median {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())